@@ -0,0 +1,292 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from app.text_analysis import AnalyzedText
+
+
+class AnalysisQueueFull(Exception):
+    """Raised when the analysis pool already has max_pending jobs."""
+
+    def __init__(self, max_pending: int):
+        super().__init__(f"Analysis queue full ({max_pending} pending)")
+        self.max_pending = max_pending
+
+
+class TextAnalyzer:
+    """
+    NLP processing plus categorization for a message: the CPU-bound part of
+    the dialogue pipeline. Both stages share one AnalyzedText per message.
+    Returns the per-stage timings alongside the result so the caller can
+    record them wherever the work actually ran.
+    """
+
+    def __init__(self, nlp_processor, categorizer=None):
+        self.nlp_processor = nlp_processor
+        self.categorizer = categorizer
+
+    def analyze(self, message: str, fields=None) -> Tuple[Tuple, Dict[str, float]]:
+        timings = {}
+        started = time.perf_counter()
+        analyzed = AnalyzedText(message)
+        processed_input = self.nlp_processor.process(analyzed, fields)
+        timings['nlp'] = time.perf_counter() - started
+        return self._categorize(analyzed, processed_input, timings), timings
+
+    def _categorize(self, analyzed: AnalyzedText, processed_input: Dict, timings: Dict[str, float]) -> Tuple:
+        # Categorize the input if categorizer is available
+        category = None
+        category_description = None
+        if self.categorizer:
+            started = time.perf_counter()
+            try:
+                category, _ = self.categorizer.predict(analyzed)
+                category_description = self.categorizer.get_category_description(category)
+            except Exception as e:
+                print(f"Categorization failed: {e}")
+            timings['categorize'] = time.perf_counter() - started
+
+        return processed_input, category, category_description
+
+    def analyze_many(self, messages: List[str], fields: List) -> List:
+        """
+        analyze() for each message, with messages that ask for the same fields
+        run through NLPProcessor.process_batch together and all messages
+        categorized with one PhilosophicalCategorizer.predict_batch call. A
+        failing message yields its exception instead. Stage times are split
+        evenly across the messages that shared the call.
+        """
+        results = [None] * len(messages)
+        analyses = [AnalyzedText(message) for message in messages]
+        processed_inputs = [None] * len(messages)
+        timings = [{} for _ in messages]
+        groups: Dict[Tuple, List[int]] = {}
+        for index, message_fields in enumerate(fields):
+            groups.setdefault(tuple(message_fields) if message_fields is not None else None, []).append(index)
+
+        for group_fields, indexes in groups.items():
+            started = time.perf_counter()
+            try:
+                processed = self.nlp_processor.process_batch([analyses[i] for i in indexes], group_fields)
+            except Exception as e:
+                for i in indexes:
+                    results[i] = e
+                continue
+            nlp_seconds = (time.perf_counter() - started) / len(indexes)
+            for i, processed_input in zip(indexes, processed):
+                processed_inputs[i] = processed_input
+                timings[i]['nlp'] = nlp_seconds
+
+        analyzed = [i for i, result in enumerate(results) if result is None]
+        categories = self._categorize_many([analyses[i] for i in analyzed], [timings[i] for i in analyzed])
+        for i, (category, category_description) in zip(analyzed, categories):
+            results[i] = ((processed_inputs[i], category, category_description), timings[i])
+        return results
+
+    def _categorize_many(self, analyses: List[AnalyzedText], timings: List[Dict[str, float]]) -> List[Tuple]:
+        """(category, description) per message via predict_batch; per message if the batch call fails."""
+        if not self.categorizer or not analyses:
+            return [(None, None)] * len(analyses)
+        started = time.perf_counter()
+        try:
+            predictions = self.categorizer.predict_batch(analyses)
+        except Exception:
+            # Fall back to one message at a time so only the failing ones lose their category
+            return [self._categorize(analyzed, None, message_timings)[1:]
+                    for analyzed, message_timings in zip(analyses, timings)]
+        categorize_seconds = (time.perf_counter() - started) / len(analyses)
+        results = []
+        for (category, _), message_timings in zip(predictions, timings):
+            message_timings['categorize'] = categorize_seconds
+            results.append((category, self.categorizer.get_category_description(category)))
+        return results
+
+
+# Per-process analyzer for the process pool, built once by _init_worker, and
+# the categorizer generation it holds (see AnalysisPool.set_categorizer)
+_worker_analyzer: Optional[TextAnalyzer] = None
+_worker_generation = 0
+
+
+def _load_worker_categorizer():
+    from app.ml_categorizer import PhilosophicalCategorizer
+
+    categorizer = PhilosophicalCategorizer()
+    try:
+        if not categorizer.load_model():
+            print("Warning: ML model not found in analysis worker, questions will not be categorized")
+            return None
+    except Exception as e:
+        print(f"Warning: Could not load ML categorizer in analysis worker: {e}")
+        return None
+    stats = categorizer.load_stats
+    print(f"Analysis worker {stats['pid']}: categorizer loaded in {stats['load_ms']} ms (RSS {stats['rss_mb']} MB)")
+    return categorizer
+
+
+def _init_worker():
+    """Load NLTK resources and the categorizer once per worker process."""
+    global _worker_analyzer
+    from app.nlp_processor import NLPProcessor
+
+    nlp_processor = NLPProcessor()
+    nlp_processor.preload()
+    _worker_analyzer = TextAnalyzer(nlp_processor, _load_worker_categorizer())
+
+
+def _worker_call(method: str, submitted_at: float, generation: int, *args):
+    global _worker_generation
+    started_at = time.time()
+    if generation != _worker_generation:
+        # A model was swapped in after this worker started: reload it from disk
+        _worker_generation = generation
+        _worker_analyzer.categorizer = _load_worker_categorizer()
+    return started_at - submitted_at, getattr(_worker_analyzer, method)(*args)
+
+
+def _warm_up():
+    return os.getpid()
+
+
+class AnalysisPool:
+    """
+    Runs TextAnalyzer work off the event loop.
+
+    kind is "thread" (shares the app's analyzer; NLTK and scikit-learn release
+    the GIL only partly, so this mainly keeps the loop responsive), "process"
+    (one analyzer per worker process, preloaded at startup; true parallelism)
+    or "inline" (run on the event loop, the old behaviour). At most
+    max_pending jobs may be queued or running; beyond that AnalysisQueueFull
+    is raised rather than letting the backlog grow without bound.
+    """
+
+    def __init__(self, analyzer: TextAnalyzer, kind: str = 'thread', workers: int = 4, max_pending: int = 64):
+        if kind not in ('thread', 'process', 'inline'):
+            raise ValueError(f"Unknown analysis executor: {kind}")
+        self.analyzer = analyzer
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_times = deque(maxlen=500)
+        self.categorizer_generation = 0
+        if kind == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analysis')
+        elif kind == 'process':
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+        else:
+            self.executor = None
+
+    @classmethod
+    def from_env(cls, analyzer: TextAnalyzer) -> "AnalysisPool":
+        return cls(
+            analyzer,
+            kind=os.getenv('ANALYSIS_EXECUTOR', 'thread').lower(),
+            workers=int(os.getenv('ANALYSIS_WORKERS', str(min(4, os.cpu_count() or 1)))),
+            max_pending=int(os.getenv('ANALYSIS_QUEUE_SIZE', '64'))
+        )
+
+    def start(self):
+        """Spawn and initialize process workers now instead of on the first request."""
+        if self.kind == 'process':
+            for _ in range(self.workers):
+                self.executor.submit(_warm_up)
+
+    def set_categorizer(self, categorizer):
+        """
+        Swap in a newly available categorizer. Thread and inline analysis use
+        it at once; process workers reload the saved model on their next job.
+        """
+        self.analyzer.categorizer = categorizer
+        self.categorizer_generation += 1
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def analyze(self, message: str, fields=None):
+        """Returns ((processed_input, category, category_description), timings, queue_wait)."""
+        return await self._run('analyze', message, fields)
+
+    async def analyze_many(self, messages: List[str], fields: List):
+        """Returns (results, queue_wait); results as in TextAnalyzer.analyze_many."""
+        if self.kind != 'process' or len(messages) <= 1:
+            results, _, waited = await self._run('analyze_many', messages, fields)
+            return results, waited
+        # Spread a large batch over the worker processes
+        size = math.ceil(len(messages) / self.workers)
+        parts = await asyncio.gather(*[
+            self._run('analyze_many', messages[i:i + size], fields[i:i + size])
+            for i in range(0, len(messages), size)
+        ])
+        return [result for results, _, _ in parts for result in results], max(waited for _, _, waited in parts)
+
+    async def _run(self, method: str, *args):
+        if self.kind == 'inline':
+            result = getattr(self.analyzer, method)(*args)
+            self.completed += 1
+            return self._unpack(method, result, 0.0)
+
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise AnalysisQueueFull(self.max_pending)
+
+        self.pending += 1
+        loop = asyncio.get_running_loop()
+        try:
+            if self.kind == 'thread':
+                submitted_at = time.perf_counter()
+
+                def call():
+                    return time.perf_counter() - submitted_at, getattr(self.analyzer, method)(*args)
+
+                waited, result = await loop.run_in_executor(self.executor, call)
+            else:
+                waited, result = await loop.run_in_executor(
+                    self.executor, _worker_call, method, time.time(), self.categorizer_generation, *args
+                )
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        self.wait_times.append(waited)
+        return self._unpack(method, result, waited)
+
+    @staticmethod
+    def _unpack(method: str, result, waited: float):
+        if method == 'analyze':
+            analysis, timings = result
+            return analysis, timings, waited
+        return result, None, waited
+
+    def stats(self) -> Dict[str, float]:
+        waits = sorted(self.wait_times)
+
+        def percentile(p):
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(math.ceil(p / 100 * len(waits))) - 1)]
+
+        busy = min(self.pending, self.workers)
+        return {
+            'executor': self.kind,
+            'workers': self.workers,
+            'pending': self.pending,
+            'queued': max(0, self.pending - self.workers),
+            'max_pending': self.max_pending,
+            'saturation': busy / self.workers if self.workers else 0.0,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'wait_p50': percentile(50),
+            'wait_p95': percentile(95)
+        }
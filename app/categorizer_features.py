@@ -0,0 +1,104 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app.text_analysis import KEYWORD_MATCHER, AnalyzedText, KeywordMatcher, analyze_text
+
+
+class PhilosophicalFeatures:
+    """
+    The categorizer's feature transformer: TF-IDF of the cleaned text followed
+    by one 0/1 column per keyword category, returned as a single sparse CSR
+    matrix. Nothing is densified, so memory stays proportional to the number
+    of non-zero features however large max_features grows. Values are
+    float32 with int32 indices, the layout scikit-learn's trees convert to
+    anyway, so predictions can skip that conversion.
+
+    Keywords come from the shared lexicon (app/data/philosophical_keywords.json)
+    and are read off each AnalyzedText, unless the transformer was built with
+    its own keyword_matcher, e.g. for a model artifact trained on another lexicon.
+
+    Lives in its own module so pickles reference app.categorizer_features
+    even when ml_categorizer.py is run as a script.
+    """
+
+    # Class-level default, so transformers pickled before it existed still load
+    keyword_matcher: Optional[KeywordMatcher] = None
+
+    def __init__(
+        self,
+        keyword_categories: Sequence[str],
+        max_features: Optional[int] = 100,
+        ngram_range: Tuple[int, int] = (1, 2),
+        vectorizer: Optional[TfidfVectorizer] = None,
+        keyword_matcher: Optional[KeywordMatcher] = None
+    ):
+        self.keyword_categories = tuple(keyword_categories)
+        self.vectorizer = vectorizer or TfidfVectorizer(max_features=max_features, ngram_range=ngram_range)
+        if keyword_matcher is not None:
+            self.keyword_matcher = keyword_matcher
+
+    @property
+    def lexicon(self) -> Dict[str, List[str]]:
+        return (self.keyword_matcher or KEYWORD_MATCHER).lexicon
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer: TfidfVectorizer, keyword_categories: Sequence[str]) -> "PhilosophicalFeatures":
+        """Wrap an already fitted TfidfVectorizer (as pickled by older versions)."""
+        return cls(keyword_categories, vectorizer=vectorizer)
+
+    @property
+    def n_features(self) -> int:
+        return len(self.vectorizer.vocabulary_) + len(self.keyword_categories)
+
+    def fit(self, texts: Iterable[Union[str, AnalyzedText]]) -> "PhilosophicalFeatures":
+        self.fit_transform(texts)
+        return self
+
+    def fit_transform(self, texts: Iterable[Union[str, AnalyzedText]]) -> sparse.csr_matrix:
+        analyses = [analyze_text(text) for text in texts]
+        tfidf = self.vectorizer.fit_transform([analyzed.normalized for analyzed in analyses])
+        return self._combine(tfidf, analyses)
+
+    def transform(self, texts: Iterable[Union[str, AnalyzedText]]) -> sparse.csr_matrix:
+        analyses = [analyze_text(text) for text in texts]
+        tfidf = self.vectorizer.transform([analyzed.normalized for analyzed in analyses])
+        return self._combine(tfidf, analyses)
+
+    def _keyword_columns(self, analyses: List[AnalyzedText]) -> List[List[int]]:
+        columns = {category: i for i, category in enumerate(self.keyword_categories)}
+        matcher = self.keyword_matcher
+        if matcher is not None:
+            found = [matcher.find_categories(analyzed.lower) for analyzed in analyses]
+        else:
+            found = [analyzed.keyword_categories for analyzed in analyses]
+        return [[columns[category] for category in categories if category in columns] for categories in found]
+
+    def _combine(self, tfidf: sparse.csr_matrix, analyses: List[AnalyzedText]) -> sparse.csr_matrix:
+        # Equivalent to hstacking tfidf with a 0/1 keyword matrix as CSR, but
+        # writes the CSR arrays directly: hstack's COO round trip dominated the
+        # cost of a single-message predict
+        tfidf = tfidf.tocsr()
+        n_tfidf = tfidf.shape[1]
+        rows = self._keyword_columns(analyses)
+        tfidf_counts = np.diff(tfidf.indptr)
+        keyword_counts = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+        indptr = np.zeros(len(rows) + 1, dtype=np.int32)
+        np.cumsum(tfidf_counts + keyword_counts, out=indptr[1:])
+
+        nnz = int(indptr[-1])
+        indices = np.empty(nnz, dtype=np.int32)
+        data = np.ones(nnz, dtype=np.float32)
+        # Each row holds its TF-IDF entries first, then its keyword columns
+        tfidf_rows = np.repeat(np.arange(len(rows)), tfidf_counts)
+        tfidf_positions = indptr[tfidf_rows] + (np.arange(tfidf.nnz) - tfidf.indptr[tfidf_rows])
+        indices[tfidf_positions] = tfidf.indices
+        data[tfidf_positions] = tfidf.data
+        keyword_positions = np.ones(nnz, dtype=bool)
+        keyword_positions[tfidf_positions] = False
+        indices[keyword_positions] = np.fromiter(
+            (n_tfidf + column for row in rows for column in row), dtype=np.int32, count=int(keyword_counts.sum())
+        )
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(rows), n_tfidf + len(self.keyword_categories)))
@@ -1,112 +1,616 @@
 import os
-from typing import Optional, Dict, Any
-from anthropic import Anthropic, RateLimitError, APIError
+import asyncio
+import math
+import random
+import time
+from typing import Optional, Dict, Any, AsyncIterator, List
+from anthropic import AsyncAnthropic, RateLimitError, APIError
 import openai
-from openai import OpenAI
+from openai import AsyncOpenAI
 from fastapi import HTTPException
-import time
 import google.generativeai as genai
+from google.api_core.exceptions import GoogleAPIError, ResourceExhausted
+
+from app.metrics import (
+    LLM_ERRORS, LLM_FAILOVERS, LLM_FIRST_TOKEN_SECONDS, LLM_RATE_LIMITS, LLM_REQUEST_SECONDS, LLM_RETRIES
+)
+from app.provider_stats import ProviderStats
+from app.rate_limiter import AdmissionController, AdmissionRejected
+from app.response_cache import ResponseCache
+from app.simulated_llm import SimulatedLLM, SimulatedRateLimitError, SimulatedAPIError
+from app.single_flight import SingleFlight
+
+# Errors that mean "slow down" rather than "something is broken"
+RATE_LIMIT_ERRORS = (RateLimitError, openai.RateLimitError, ResourceExhausted, SimulatedRateLimitError)
+API_ERRORS = (APIError, openai.APIError, GoogleAPIError, SimulatedAPIError)
 
 class LLMService:
     def __init__(self):
-        self.provider = os.getenv('LLM_PROVIDER', 'anthropic').lower()
+        # LLM_PROVIDERS is an ordered failover chain, e.g. "anthropic,openai";
+        # LLM_PROVIDER alone configures a single provider as before.
+        providers = os.getenv('LLM_PROVIDERS') or os.getenv('LLM_PROVIDER', 'anthropic')
+        self.providers = [p.strip().lower() for p in providers.split(',') if p.strip()]
+        if not self.providers:
+            raise ValueError("No LLM provider configured")
+        self.provider = self.providers[0]
+        self.models = {}
         self.anthropic_client = None
         self.openai_client = None
+        self.gemini_model = None
+        self.gemini_system_models = {}
+        self.simulated_llm = None
+        
+        for provider in self.providers:
+            self._configure_provider(provider)
         
-        if self.provider == 'anthropic':
+        self.model = self.models[self.provider]
+        # Demoted providers are retried as their error rate decays (half-life in
+        # seconds) and their latency samples go stale
+        error_half_life = float(os.getenv('LLM_ERROR_HALF_LIFE', '60'))
+        stale_after = float(os.getenv('LLM_LATENCY_STALE_AFTER', '300'))
+        self.stats = {
+            provider: ProviderStats(provider, error_half_life=error_half_life, stale_after=stale_after)
+            for provider in self.providers
+        }
+        self.temperature = 0.7
+        self.max_tokens = 1000
+        self.backoff_base = float(os.getenv('LLM_BACKOFF_BASE', '1.0'))
+        self.backoff_max = float(os.getenv('LLM_BACKOFF_MAX', '20.0'))
+        # Fire a request at the next provider once the current one has been
+        # slower than this latency percentile (0 disables hedging)
+        self.hedge_percentile = float(os.getenv('LLM_HEDGE_PERCENTILE', '0'))
+        self.hedge_min_samples = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+        self.hedges = 0
+        self.unhealthy_error_rate = float(os.getenv('LLM_UNHEALTHY_ERROR_RATE', '0.5'))
+        self.latency_tolerance = float(os.getenv('LLM_LATENCY_TOLERANCE', '2.0'))
+        self.cache = ResponseCache.from_env()
+        self.in_flight = SingleFlight()
+        self.admission = AdmissionController.from_env(self.providers)
+    
+    def _configure_provider(self, provider: str):
+        if provider == 'anthropic':
             api_key = os.getenv('ANTHROPIC_API_KEY')
             if not api_key:
                 raise ValueError("ANTHROPIC_API_KEY not found in environment variables")
-            self.anthropic_client = Anthropic(api_key=api_key)
-            self.model = os.getenv('ANTHROPIC_MODEL', 'claude-3-5-sonnet-20241022')
+            self.anthropic_client = AsyncAnthropic(api_key=api_key)
+            self.models[provider] = os.getenv('ANTHROPIC_MODEL', 'claude-3-5-sonnet-20241022')
         
-        elif self.provider == 'openai':
+        elif provider == 'openai':
             api_key = os.getenv('OPENAI_API_KEY')
             if not api_key:
                 raise ValueError("OPENAI_API_KEY not found in environment variables")
-            self.openai_client = OpenAI(api_key=api_key)
-            self.model = os.getenv('OPENAI_MODEL', 'gpt-4-turbo-preview')
+            self.openai_client = AsyncOpenAI(api_key=api_key)
+            self.models[provider] = os.getenv('OPENAI_MODEL', 'gpt-4-turbo-preview')
         
-        elif self.provider == 'google':
+        elif provider == 'google':
             api_key = os.getenv('GOOGLE_API_KEY')
             if not api_key:
                 raise ValueError("GOOGLE_API_KEY not found in environment variables")
             genai.configure(api_key=api_key)
-            self.model = os.getenv('GOOGLE_MODEL', 'gemini-pro')
-            self.gemini_model = genai.GenerativeModel(self.model)
+            self.models[provider] = os.getenv('GOOGLE_MODEL', 'gemini-pro')
+            self.gemini_model = genai.GenerativeModel(self.models[provider])
+        
+        elif provider == 'simulated':
+            # Local fake provider for load tests and offline runs; no API key
+            self.simulated_llm = SimulatedLLM.from_env()
+            self.models[provider] = 'simulated'
         
         else:
-            raise ValueError(f"Unsupported LLM provider: {self.provider}")
+            raise ValueError(f"Unsupported LLM provider: {provider}")
+    
+    def _backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with equal jitter (half fixed, half random) so retrying callers spread out."""
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(ceiling / 2, ceiling)
+    
+    def ranked_providers(self) -> List[str]:
+        """
+        Providers in the order they should be tried. Configured order is kept,
+        except that providers with a high recent error rate, or a median
+        latency well above the fastest provider's, are moved to the back.
+        """
+        healthy = [p for p in self.providers if self.stats[p].error_rate <= self.unhealthy_error_rate]
+        medians = [self.stats[p].percentile(50) for p in healthy]
+        fastest = min((m for m in medians if m is not None), default=None)
+        
+        def rank(provider):
+            stats = self.stats[provider]
+            unhealthy = stats.error_rate > self.unhealthy_error_rate
+            median = stats.percentile(50)
+            slow = fastest is not None and median is not None and median > fastest * self.latency_tolerance
+            return (unhealthy, slow, stats.score() if unhealthy or slow else 0.0)
+        
+        return sorted(self.providers, key=rank)
+    
+    def _hedge_delay(self, provider: str) -> Optional[float]:
+        stats = self.stats[provider]
+        if self.hedge_percentile <= 0 or len(stats.latencies) < self.hedge_min_samples:
+            return None
+        return stats.percentile(self.hedge_percentile)
     
-    async def generate_response(self, prompt: str, max_retries: int = 3) -> str:
+    def cache_key(self, prompt: str, system: Optional[str] = None) -> str:
+        """
+        Provider-agnostic within the configured chain: a cached answer may come
+        from any provider in it (failover, hedging), so the key covers the whole
+        chain and its models rather than the provider that happened to answer.
+        Changing the chain or a model starts a fresh cache.
+        """
+        return ResponseCache.make_key(
+            ','.join(self.providers),
+            ','.join(self.models[provider] for provider in self.providers),
+            self.temperature, prompt, system or ''
+        )
+    
+    async def generate_response(
+        self,
+        prompt: str,
+        max_retries: int = 3,
+        use_cache: bool = True,
+        system: Optional[str] = None,
+        usage: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Generate a response for the prompt. `system` is the static instruction
+        prefix; it is sent separately so providers can cache it. Identical
+        prompts are answered from the response cache when one is configured,
+        and concurrent identical prompts share a single upstream call.
+        use_cache=False skips both. If a `usage` dict is passed it is filled
+        with the token usage of the call, including cached input tokens, and
+        'incomplete' (the reason) when the provider did not finish normally,
+        e.g. a content-filter block or the max-tokens limit; such responses
+        are not cached.
+        """
+        if not use_cache:
+            response, call_usage = await self._generate_with_retries(prompt, system, max_retries)
+        else:
+            key = self.cache_key(prompt, system)
+            cached = await self.cache.get_async(key) if self.cache is not None else None
+            if cached:
+                response, call_usage = cached, {'response_cache_hit': True}
+            else:
+                response, call_usage = await self.in_flight.do(
+                    key, lambda: self._generate_and_cache(key, prompt, system, max_retries)
+                )
+        
+        if usage is not None:
+            usage.update(call_usage)
+        return response
+    
+    async def _generate_and_cache(self, key: str, prompt: str, system: Optional[str], max_retries: int):
+        response, usage = await self._generate_with_retries(prompt, system, max_retries)
+        if self.cache is not None and response and not usage.get('incomplete'):
+            await self.cache.set_async(key, response)
+        return response, usage
+    
+    async def _generate_with_retries(self, prompt: str, system: Optional[str], max_retries: int):
+        # Each attempt walks the provider chain, failing over on rate-limit
+        # and API errors; we only back off once every provider has failed.
+        last_error = None
         for attempt in range(max_retries):
-            try:
-                if self.provider == 'anthropic':
-                    return await self._generate_anthropic_response(prompt)
-                elif self.provider == 'openai':
-                    return await self._generate_openai_response(prompt)
-                elif self.provider == 'google':
-                    return await self._generate_gemini_response(prompt)
-                    
-            except RateLimitError:
-                if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 2
-                    time.sleep(wait_time)
-                else:
+            providers = self.ranked_providers()
+            rejections = []
+            # Providers already called in this attempt, including hedge backups
+            tried = set()
+            for index, provider in enumerate(providers):
+                if provider in tried:
+                    continue
+                tried.add(provider)
+                backup = next((p for p in providers[index + 1:] if p not in tried), None)
+                try:
+                    return await self._call_with_hedge(provider, backup, prompt, system, tried)
+                
+                except AdmissionRejected as e:
+                    rejections.append(e)
+                
+                except RATE_LIMIT_ERRORS + API_ERRORS as e:
+                    last_error = e
+                    if backup:
+                        LLM_FAILOVERS.inc(provider=provider)
+                
+                except genai.types.BlockedPromptException as e:
+                    # Handle Gemini content filter blocks
                     raise HTTPException(
-                        status_code=429,
-                        detail="API rate limit exceeded. Please try again later."
+                        status_code=400,
+                        detail="The request was blocked by content filters. Please try rephrasing your question."
                     )
-            
-            except (APIError, openai.APIError) as e:
-                if attempt < max_retries - 1:
-                    time.sleep(1)
-                else:
+                
+                except Exception as e:
                     raise HTTPException(
                         status_code=500,
-                        detail=f"API error: {str(e)}"
+                        detail=f"Unexpected error: {str(e)}"
                     )
             
-            except genai.types.BlockedPromptException as e:
-                # Handle Gemini content filter blocks
-                raise HTTPException(
-                    status_code=400,
-                    detail="The request was blocked by content filters. Please try rephrasing your question."
-                )
+            # Every provider is over its client-side limit: fail fast rather
+            # than retrying into the same limit
+            if len(rejections) == len(providers):
+                raise self._admission_error(rejections)
             
-            except Exception as e:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Unexpected error: {str(e)}"
-                )
+            if attempt < max_retries - 1:
+                LLM_RETRIES.inc()
+                rate_limited = isinstance(last_error, RATE_LIMIT_ERRORS)
+                await asyncio.sleep(self._backoff_delay(attempt + 1 if rate_limited else attempt))
+        
+        if isinstance(last_error, RATE_LIMIT_ERRORS):
+            raise HTTPException(
+                status_code=429,
+                detail="API rate limit exceeded. Please try again later."
+            )
+        raise HTTPException(
+            status_code=500,
+            detail=f"API error: {str(last_error)}"
+        )
+    
+    def _estimate_tokens(self, prompt: str, system: Optional[str] = None) -> int:
+        # Rough chars-per-token estimate plus the completion budget
+        return (len(prompt) + len(system or '')) // 4 + self.max_tokens
+    
+    @staticmethod
+    def _usage(provider: str, input_tokens: int = 0, cached_input_tokens: int = 0, output_tokens: int = 0) -> Dict[str, Any]:
+        return {
+            'provider': provider,
+            'input_tokens': input_tokens,
+            'cached_input_tokens': cached_input_tokens,
+            'uncached_input_tokens': input_tokens - cached_input_tokens,
+            'output_tokens': output_tokens
+        }
+    
+    def _admission_error(self, rejections: List[AdmissionRejected]) -> HTTPException:
+        retry_after = max(1, math.ceil(min(r.retry_after for r in rejections)))
+        return HTTPException(
+            status_code=429,
+            detail="Too many requests for the LLM provider. Please try again later.",
+            headers={"Retry-After": str(retry_after)}
+        )
+    
+    async def _call_with_hedge(self, provider: str, backup: Optional[str], prompt: str, system: Optional[str], tried: set):
+        """
+        Call provider; if it is slower than its hedge threshold, also call
+        backup (adding it to `tried`) and return whichever succeeds first.
+        """
+        primary = asyncio.ensure_future(self._call_provider(provider, prompt, system))
+        tasks = {primary}
+        try:
+            delay = self._hedge_delay(provider) if backup else None
+            if delay is None:
+                return await primary
+            
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedges += 1
+                tried.add(backup)
+                tasks.add(asyncio.ensure_future(self._call_provider(backup, prompt, system)))
+            
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            raise primary.exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    async def _call_provider(self, provider: str, prompt: str, system: Optional[str]):
+        await self.admission.acquire(provider, self._estimate_tokens(prompt, system))
+        stats = self.stats[provider]
+        started = time.perf_counter()
+        try:
+            if provider == 'anthropic':
+                response, usage = await self._generate_anthropic_response(prompt, system)
+            elif provider == 'openai':
+                response, usage = await self._generate_openai_response(prompt, system)
+            elif provider == 'google':
+                response, usage = await self._generate_gemini_response(prompt, system)
+            elif provider == 'simulated':
+                text, input_tokens, cached_tokens, output_tokens = await self.simulated_llm.generate(prompt, system)
+                response, usage = text, self._usage(provider, input_tokens, cached_tokens, output_tokens)
+        except RATE_LIMIT_ERRORS:
+            stats.record_error(rate_limited=True)
+            LLM_RATE_LIMITS.inc(provider=provider)
+            self._observe_latency(provider, started, 'rate_limited')
+            raise
+        except API_ERRORS:
+            stats.record_error()
+            LLM_ERRORS.inc(provider=provider)
+            self._observe_latency(provider, started, 'error')
+            raise
+        stats.record_success(time.perf_counter() - started)
+        stats.record_usage(usage)
+        self._observe_latency(provider, started, 'ok')
+        return response, usage
+    
+    def _observe_latency(self, provider: str, started: float, outcome: str):
+        LLM_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            provider=provider,
+            model=self.models[provider],
+            outcome=outcome
+        )
+    
+    def provider_stats(self) -> Dict[str, Any]:
+        return {
+            'order': self.ranked_providers(),
+            'hedges': self.hedges,
+            'providers': {p: self.stats[p].snapshot() for p in self.providers},
+            'admission': self.admission.stats()
+        }
+    
+    async def stream_response(
+        self,
+        prompt: str,
+        max_retries: int = 3,
+        use_cache: bool = True,
+        system: Optional[str] = None,
+        usage: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Yield the response text in chunks as the provider produces them.
+        A cached response is yielded as a single chunk, and a stream that
+        finished normally with some text is stored in the cache. `usage` is
+        filled once the stream completes, as for generate_response.
+        """
+        usage = usage if usage is not None else {}
+        if self.cache is None or not use_cache:
+            async for chunk in self._stream_with_retries(prompt, system, max_retries, usage):
+                yield chunk
+            return
+        
+        key = self.cache_key(prompt, system)
+        cached = await self.cache.get_async(key)
+        if cached:
+            usage['response_cache_hit'] = True
+            yield cached
+            return
+        
+        chunks = []
+        async for chunk in self._stream_with_retries(prompt, system, max_retries, usage):
+            chunks.append(chunk)
+            yield chunk
+        response = ''.join(chunks)
+        if response and not usage.get('incomplete'):
+            await self.cache.set_async(key, response)
     
-    async def _generate_anthropic_response(self, prompt: str) -> str:
-        response = self.anthropic_client.messages.create(
-            model=self.model,
-            max_tokens=1000,
-            temperature=0.7,
-            messages=[{
+    async def _stream_with_retries(
+        self,
+        prompt: str,
+        system: Optional[str],
+        max_retries: int,
+        usage: Dict[str, Any]
+    ) -> AsyncIterator[str]:
+        # Failures before the first chunk fail over and retry like
+        # generate_response; once text has been sent to the caller the
+        # error is raised as-is.
+        last_error = None
+        for attempt in range(max_retries):
+            providers = self.ranked_providers()
+            rejections = []
+            for provider in providers:
+                started = False
+                call_started = time.perf_counter()
+                try:
+                    await self.admission.acquire(provider, self._estimate_tokens(prompt, system))
+                    call_started = time.perf_counter()
+                    if provider == 'anthropic':
+                        chunks = self._stream_anthropic_response(prompt, system, usage)
+                    elif provider == 'openai':
+                        chunks = self._stream_openai_response(prompt, system, usage)
+                    elif provider == 'google':
+                        chunks = self._stream_gemini_response(prompt, system, usage)
+                    elif provider == 'simulated':
+                        chunks = self._stream_simulated_response(prompt, system, usage)
+                    
+                    async for chunk in chunks:
+                        if not started:
+                            started = True
+                            LLM_FIRST_TOKEN_SECONDS.observe(
+                                time.perf_counter() - call_started, provider=provider, model=self.models[provider]
+                            )
+                        yield chunk
+                    # Total stream time, so ranking and hedging compare it with non-streamed calls
+                    self.stats[provider].record_success(time.perf_counter() - call_started)
+                    self.stats[provider].record_usage(usage)
+                    self._observe_latency(provider, call_started, 'ok')
+                    return
+                
+                except AdmissionRejected as e:
+                    rejections.append(e)
+                
+                except RATE_LIMIT_ERRORS as e:
+                    self.stats[provider].record_error(rate_limited=True)
+                    LLM_RATE_LIMITS.inc(provider=provider)
+                    self._observe_latency(provider, call_started, 'rate_limited')
+                    if started:
+                        raise HTTPException(
+                            status_code=429,
+                            detail="API rate limit exceeded. Please try again later."
+                        )
+                    last_error = e
+                
+                except API_ERRORS as e:
+                    self.stats[provider].record_error()
+                    LLM_ERRORS.inc(provider=provider)
+                    self._observe_latency(provider, call_started, 'error')
+                    if started:
+                        raise HTTPException(
+                            status_code=500,
+                            detail=f"API error: {str(e)}"
+                        )
+                    last_error = e
+                
+                except genai.types.BlockedPromptException:
+                    raise HTTPException(
+                        status_code=400,
+                        detail="The request was blocked by content filters. Please try rephrasing your question."
+                    )
+            
+            if len(rejections) == len(providers):
+                raise self._admission_error(rejections)
+            
+            if attempt < max_retries - 1:
+                LLM_RETRIES.inc()
+                rate_limited = isinstance(last_error, RATE_LIMIT_ERRORS)
+                await asyncio.sleep(self._backoff_delay(attempt + 1 if rate_limited else attempt))
+        
+        if isinstance(last_error, RATE_LIMIT_ERRORS):
+            raise HTTPException(
+                status_code=429,
+                detail="API rate limit exceeded. Please try again later."
+            )
+        raise HTTPException(
+            status_code=500,
+            detail=f"API error: {str(last_error)}"
+        )
+    
+    def _anthropic_request(self, prompt: str, system: Optional[str]) -> Dict[str, Any]:
+        request = {
+            'model': self.models['anthropic'],
+            'max_tokens': self.max_tokens,
+            'temperature': self.temperature,
+            'messages': [{
                 "role": "user",
                 "content": prompt
             }]
+        }
+        if system:
+            # Mark the static instructions as a cacheable prefix
+            request['system'] = [{
+                "type": "text",
+                "text": system,
+                "cache_control": {"type": "ephemeral"}
+            }]
+        return request
+    
+    def _anthropic_usage(self, usage) -> Dict[str, Any]:
+        cache_read = getattr(usage, 'cache_read_input_tokens', None) or 0
+        cache_write = getattr(usage, 'cache_creation_input_tokens', None) or 0
+        return self._usage('anthropic', usage.input_tokens + cache_read + cache_write, cache_read, usage.output_tokens)
+    
+    def _openai_messages(self, prompt: str, system: Optional[str]) -> List[Dict[str, str]]:
+        # OpenAI caches long identical prefixes automatically, so the static
+        # system message just needs to come first
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({
+            "role": "user",
+            "content": prompt
+        })
+        return messages
+    
+    def _openai_usage(self, usage) -> Dict[str, Any]:
+        if usage is None:
+            return self._usage('openai')
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached = (details.cached_tokens or 0) if details else 0
+        return self._usage('openai', usage.prompt_tokens, cached, usage.completion_tokens)
+    
+    async def _generate_anthropic_response(self, prompt: str, system: Optional[str] = None):
+        response = await self.anthropic_client.beta.prompt_caching.messages.create(
+            **self._anthropic_request(prompt, system)
         )
-        return response.content[0].text
+        usage = self._anthropic_usage(response.usage)
+        if response.stop_reason == 'max_tokens':
+            usage['incomplete'] = response.stop_reason
+        return response.content[0].text, usage
     
-    async def _generate_openai_response(self, prompt: str) -> str:
-        response = self.openai_client.chat.completions.create(
-            model=self.model,
-            messages=[{
-                "role": "user",
-                "content": prompt
-            }],
-            max_tokens=1000,
-            temperature=0.7
+    async def _generate_openai_response(self, prompt: str, system: Optional[str] = None):
+        response = await self.openai_client.chat.completions.create(
+            model=self.models['openai'],
+            messages=self._openai_messages(prompt, system),
+            max_tokens=self.max_tokens,
+            temperature=self.temperature
+        )
+        usage = self._openai_usage(response.usage)
+        if response.choices[0].finish_reason in ('length', 'content_filter'):
+            usage['incomplete'] = response.choices[0].finish_reason
+        return response.choices[0].message.content, usage
+    
+    async def _stream_anthropic_response(self, prompt: str, system: Optional[str], usage: Dict[str, Any]) -> AsyncIterator[str]:
+        async with self.anthropic_client.beta.prompt_caching.messages.stream(
+            **self._anthropic_request(prompt, system)
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            final = await stream.get_final_message()
+        usage.update(self._anthropic_usage(final.usage))
+        if final.stop_reason == 'max_tokens':
+            usage['incomplete'] = final.stop_reason
+    
+    async def _stream_openai_response(self, prompt: str, system: Optional[str], usage: Dict[str, Any]) -> AsyncIterator[str]:
+        stream = await self.openai_client.chat.completions.create(
+            model=self.models['openai'],
+            messages=self._openai_messages(prompt, system),
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.choices and chunk.choices[0].finish_reason in ('length', 'content_filter'):
+                usage['incomplete'] = chunk.choices[0].finish_reason
+            if chunk.usage:
+                usage.update(self._openai_usage(chunk.usage))
+    
+    async def _stream_gemini_response(self, prompt: str, system: Optional[str], usage: Dict[str, Any]) -> AsyncIterator[str]:
+        response = await self._gemini_model_for(system).generate_content_async(
+            prompt,
+            generation_config=self._gemini_generation_config(),
+            safety_settings=self._gemini_safety_settings(),
+            stream=True
+        )
+        async for chunk in response:
+            if chunk.candidates and chunk.candidates[0].content.parts:
+                yield chunk.candidates[0].content.parts[0].text
+            if getattr(chunk, 'usage_metadata', None):
+                usage.update(self._gemini_usage(chunk))
+            reason = self._gemini_incomplete_reason(chunk)
+            if reason:
+                usage['incomplete'] = reason
+    
+    async def _stream_simulated_response(self, prompt: str, system: Optional[str], usage: Dict[str, Any]) -> AsyncIterator[str]:
+        output_tokens = 0
+        async for chunk in self.simulated_llm.stream(prompt, system):
+            output_tokens += len(chunk.split())
+            yield chunk
+        input_tokens, cached_tokens = self.simulated_llm.input_tokens(prompt, system)
+        usage.update(self._usage('simulated', input_tokens, cached_tokens, output_tokens))
+    
+    def _gemini_model_for(self, system: Optional[str]):
+        # Gemini takes the instructions at model construction; explicit
+        # context caching needs a far longer prefix than ours, so this only
+        # keeps the instructions out of the per-request content
+        if not system:
+            return self.gemini_model
+        model = self.gemini_system_models.get(system)
+        if model is None:
+            model = genai.GenerativeModel(self.models['google'], system_instruction=system)
+            self.gemini_system_models[system] = model
+        return model
+    
+    def _gemini_usage(self, response) -> Dict[str, Any]:
+        metadata = getattr(response, 'usage_metadata', None)
+        if metadata is None:
+            return self._usage('google')
+        return self._usage(
+            'google',
+            metadata.prompt_token_count,
+            metadata.cached_content_token_count,
+            metadata.candidates_token_count
+        )
+    
+    def _gemini_generation_config(self):
+        return genai.types.GenerationConfig(
+            max_output_tokens=self.max_tokens,
+            temperature=self.temperature,
+            top_p=0.9,
+            top_k=40
         )
-        return response.choices[0].message.content
     
-    async def _generate_gemini_response(self, prompt: str) -> str:
+    def _gemini_safety_settings(self):
         # Configure safety settings to be less restrictive for philosophical dialogue
-        safety_settings = [
+        return [
             {
                 "category": "HARM_CATEGORY_HARASSMENT",
                 "threshold": "BLOCK_ONLY_HIGH"
@@ -124,50 +628,62 @@ class LLMService:
                 "threshold": "BLOCK_ONLY_HIGH"
             }
         ]
-        
+    
+    async def _generate_gemini_response(self, prompt: str, system: Optional[str] = None):
         try:
-            response = self.gemini_model.generate_content(
+            response = await self._gemini_model_for(system).generate_content_async(
                 prompt,
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=1000,
-                    temperature=0.7,
-                    top_p=0.9,
-                    top_k=40
-                ),
-                safety_settings=safety_settings
+                generation_config=self._gemini_generation_config(),
+                safety_settings=self._gemini_safety_settings()
             )
-            
-            # Check if response was blocked
-            if hasattr(response, 'prompt_feedback') and response.prompt_feedback.block_reason:
-                return "I apologize, but I cannot provide a response to this query. Please try rephrasing your question or asking about a different topic."
-            
-            # Check candidates
-            if response.candidates:
-                candidate = response.candidates[0]
-                
-                # Check finish reason
-                if hasattr(candidate, 'finish_reason') and candidate.finish_reason != 1:  # 1 = STOP (normal completion)
-                    finish_reasons = {
-                        2: "blocked by safety filters",
-                        3: "hit max tokens limit",
-                        4: "recitation issue",
-                        5: "other reason"
-                    }
-                    reason = finish_reasons.get(candidate.finish_reason, "unknown reason")
-                    return f"I apologize, but I couldn't provide a complete response ({reason}). Please try rephrasing your question."
-                
-                # Get the text from content parts
-                if hasattr(candidate.content, 'parts') and candidate.content.parts:
-                    return candidate.content.parts[0].text
-            
-            # Fallback if structure is different
-            if hasattr(response, 'text'):
-                return response.text
-            
-            return "I apologize, but I couldn't generate a proper response. Please try again with a different question."
+            text, reason = self._gemini_text(response)
+            usage = self._gemini_usage(response)
+            if reason:
+                usage['incomplete'] = reason
+            return text, usage
             
         except Exception as e:
             # Handle any other Gemini-specific errors
             if "finish_reason" in str(e):
-                return "I apologize, but I cannot provide a response to this query due to content filters. Please try rephrasing your question."
-            raise e
\ No newline at end of file
+                usage = self._usage('google')
+                usage['incomplete'] = 'blocked by content filters'
+                return "I apologize, but I cannot provide a response to this query due to content filters. Please try rephrasing your question.", usage
+            raise e
+    
+    GEMINI_FINISH_REASONS = {
+        2: "blocked by safety filters",
+        3: "hit max tokens limit",
+        4: "recitation issue",
+        5: "other reason"
+    }
+    
+    def _gemini_incomplete_reason(self, response) -> Optional[str]:
+        """Why a Gemini response (or stream chunk) did not complete normally, or None."""
+        if hasattr(response, 'prompt_feedback') and response.prompt_feedback.block_reason:
+            return "prompt blocked"
+        if response.candidates:
+            finish_reason = getattr(response.candidates[0], 'finish_reason', 1)
+            # 0 = unspecified (mid-stream), 1 = STOP (normal completion)
+            if finish_reason not in (0, 1):
+                return self.GEMINI_FINISH_REASONS.get(finish_reason, "unknown reason")
+        return None
+    
+    def _gemini_text(self, response):
+        """Return (text, incomplete_reason); the text is an apology when the reason is set."""
+        reason = self._gemini_incomplete_reason(response)
+        if reason == "prompt blocked":
+            return "I apologize, but I cannot provide a response to this query. Please try rephrasing your question or asking about a different topic.", reason
+        if reason:
+            return f"I apologize, but I couldn't provide a complete response ({reason}). Please try rephrasing your question.", reason
+        
+        # Get the text from content parts
+        if response.candidates:
+            candidate = response.candidates[0]
+            if hasattr(candidate.content, 'parts') and candidate.content.parts:
+                return candidate.content.parts[0].text, None
+        
+        # Fallback if structure is different
+        if hasattr(response, 'text'):
+            return response.text, None
+        
+        return "I apologize, but I couldn't generate a proper response. Please try again with a different question.", "no content"
@@ -1,16 +1,23 @@
 from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 import os
+import json
+import asyncio
+import time
+import threading
 from dotenv import load_dotenv
 
 from app.llm_service import LLMService
-from app.nlp_processor import NLPProcessor
+from app.nlp_processor import NLPProcessor, PIPELINE_FIELDS
+from app.analysis_pool import AnalysisPool, AnalysisQueueFull, TextAnalyzer
 from app.socratic_dialogue import SocraticDialogue
 from app.ml_categorizer import PhilosophicalCategorizer
+from app.session_store import SessionStore
+from app.metrics import ANALYSIS_QUEUE_SECONDS, REQUEST_ERRORS, observe_stage, registry, request_timings, server_timing_header
 
 load_dotenv()
 
@@ -21,79 +28,415 @@ templates = Jinja2Templates(directory="templates")
 
 llm_service = LLMService()
 nlp_processor = NLPProcessor()
-categorizer = PhilosophicalCategorizer()
+# The categorizer model is built at deploy time (train_categorizer.py, run by
+# bin/post_compile and the Dockerfile). Without one, CATEGORIZER_MODE decides:
+# "degrade" serves without categories, "fail" refuses to start, "background"
+# serves without categories while a thread trains the model, then swaps it in
+CATEGORIZER_MODES = ('degrade', 'fail', 'background')
+categorizer_mode = os.getenv('CATEGORIZER_MODE', 'degrade').lower()
+if categorizer_mode not in CATEGORIZER_MODES:
+    raise ValueError(f"Unknown CATEGORIZER_MODE: {categorizer_mode} (choose from {', '.join(CATEGORIZER_MODES)})")
 
-# Try to load the pre-trained model
+categorizer = PhilosophicalCategorizer()
+categorizer_state = 'loaded'
 try:
-    if not categorizer.load_model():
-        print("Warning: ML model not found. Training new model...")
-        categorizer.train()
+    categorizer_error = None if categorizer.load_model() else "no model found; run python train_categorizer.py"
 except Exception as e:
-    print(f"Warning: Could not load ML categorizer: {e}")
+    categorizer_error = str(e)
+
+if categorizer_error is None:
+    print(f"Categorizer loaded from {categorizer.load_stats['source']} in {categorizer.load_stats['load_ms']} ms "
+          f"(RSS {categorizer.load_stats['rss_mb']} MB, +{categorizer.load_stats['rss_delta_mb']} MB)")
+elif categorizer_mode == 'fail':
+    raise RuntimeError(f"ML categorizer unavailable ({categorizer_error}) and CATEGORIZER_MODE=fail")
+else:
     categorizer = None
+    categorizer_state = 'training' if categorizer_mode == 'background' else 'unavailable'
+    print(f"Warning: Could not load ML categorizer ({categorizer_error}); questions will not be categorized"
+          + (" until background training finishes" if categorizer_mode == 'background' else ""))
 
 socratic_dialogue = SocraticDialogue(llm_service, nlp_processor)
+session_store = SessionStore.from_env()
+# NLP and categorization run here, off the event loop (ANALYSIS_EXECUTOR)
+analysis_pool = AnalysisPool.from_env(TextAnalyzer(nlp_processor, categorizer))
+
+@app.on_event("startup")
+def preload_nlp_resources():
+    # Process workers load NLTK and the model in their initializer; start them now
+    analysis_pool.start()
+    # NLTK models load lazily; warm them after boot so the first request doesn't pay for it
+    if analysis_pool.kind != 'process' and os.getenv('NLP_PRELOAD', 'background').lower() == 'background':
+        threading.Thread(target=nlp_processor.preload, name='nlp-preload', daemon=True).start()
+    if categorizer_state == 'training':
+        threading.Thread(target=train_categorizer_in_background, name='categorizer-train', daemon=True).start()
+
+def train_categorizer_in_background():
+    """CATEGORIZER_MODE=background: train and save the model, then serve it."""
+    global categorizer, categorizer_state
+    started = time.perf_counter()
+    try:
+        PhilosophicalCategorizer().train()
+        # Load what was saved, as process workers will
+        trained = PhilosophicalCategorizer()
+        if not trained.load_model():
+            raise RuntimeError("trained model was not saved")
+    except Exception as e:
+        print(f"Warning: Background categorizer training failed: {e}")
+        categorizer_state = 'unavailable'
+        return
+    categorizer = trained
+    categorizer_state = 'loaded'
+    analysis_pool.set_categorizer(trained)
+    print(f"Categorizer trained in the background in {time.perf_counter() - started:.1f} s; now categorizing")
+
+# Expired rows in the persistent tiers are otherwise only deleted when read
+# again; sweep them at startup and then every STORAGE_PURGE_INTERVAL seconds
+STORAGE_PURGE_INTERVAL = float(os.getenv('STORAGE_PURGE_INTERVAL', '600'))
+storage_purge_task: Optional[asyncio.Task] = None
+
+async def purge_expired_storage():
+    while True:
+        try:
+            if llm_service.cache is not None:
+                await asyncio.to_thread(llm_service.cache.purge_expired)
+            await asyncio.to_thread(session_store.purge_idle)
+        except Exception as e:
+            print(f"Warning: Could not purge expired storage: {e}")
+        await asyncio.sleep(STORAGE_PURGE_INTERVAL)
+
+@app.on_event("startup")
+async def start_storage_purge():
+    global storage_purge_task
+    if STORAGE_PURGE_INTERVAL > 0:
+        storage_purge_task = asyncio.create_task(purge_expired_storage())
+
+@app.on_event("shutdown")
+def stop_analysis_pool():
+    analysis_pool.shutdown()
+    if storage_purge_task is not None:
+        storage_purge_task.cancel()
+
+def collect_runtime_metrics():
+    """Expose counters and gauges kept by the LLM service and stores at scrape time."""
+    if llm_service.cache is not None:
+        cache = llm_service.cache.stats()
+        yield ('socratic_response_cache_hits_total', 'counter', 'Response cache hits', [({}, cache['hits'])])
+        yield ('socratic_response_cache_misses_total', 'counter', 'Response cache misses', [({}, cache['misses'])])
+        yield ('socratic_response_cache_entries', 'gauge', 'Entries in the in-memory response cache', [({}, cache['entries'])])
+    flights = llm_service.in_flight.stats()
+    yield ('socratic_llm_coalesced_total', 'counter', 'Requests that shared an in-flight LLM call', [({}, flights['coalesced'])])
+    yield ('socratic_llm_hedges_total', 'counter', 'Hedged requests sent to a second provider', [({}, llm_service.hedges)])
+    admission = llm_service.admission.stats()
+    yield ('socratic_admission_queue_depth', 'gauge', 'Requests waiting for provider capacity', [({}, admission['queue_depth'])])
+    yield ('socratic_admission_rejected_total', 'counter', 'Requests rejected by admission control', [({}, admission['rejected'])])
+    yield ('socratic_admission_wait_p95_seconds', 'gauge', 'p95 admission wait over recent requests', [({}, admission['wait_p95'])])
+    providers = llm_service.provider_stats()['providers']
+    yield ('socratic_llm_input_tokens_total', 'counter', 'Input tokens sent to LLM providers', [
+        ({'provider': name, 'cached': cached}, stats['cached_input_tokens'] if cached == 'true' else stats['input_tokens'] - stats['cached_input_tokens'])
+        for name, stats in providers.items() for cached in ('true', 'false')
+    ])
+    yield ('socratic_sessions', 'gauge', 'Conversation sessions held in memory', [({}, session_store.stats()['sessions'])])
+    analysis = analysis_pool.stats()
+    yield ('socratic_analysis_pending', 'gauge', 'NLP/categorization jobs queued or running', [({}, analysis['pending'])])
+    yield ('socratic_analysis_saturation', 'gauge', 'Fraction of analysis workers busy', [({}, analysis['saturation'])])
+    yield ('socratic_analysis_rejected_total', 'counter', 'Analysis jobs rejected because the queue was full', [({}, analysis['rejected'])])
+    token_cache = nlp_processor.cache_stats()
+    yield ('socratic_nlp_token_cache_hits_total', 'counter', 'Token normalization cache hits', [({}, token_cache['hits'])])
+    yield ('socratic_nlp_token_cache_misses_total', 'counter', 'Token normalization cache misses', [({}, token_cache['misses'])])
+
+registry.register_collector(collect_runtime_metrics)
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Collect per-stage timings for the request and report them in Server-Timing."""
+    timings = {}
+    token = request_timings.set(timings)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_timings.reset(token)
+    if timings:
+        timings['total'] = time.perf_counter() - started
+        response.headers['Server-Timing'] = server_timing_header(timings)
+    return response
+
+# Upper bounds for /api/dialogue/batch
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '1000'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
 
 class DialogueRequest(BaseModel):
     message: str
     context: Optional[str] = None
+    session_id: Optional[str] = None
+    new_session: bool = False
+    bypass_cache: bool = False
+    analysis_fields: Optional[List[str]] = None
 
 class DialogueResponse(BaseModel):
     response: str
     processed_input: dict
     category: Optional[str] = None
     category_description: Optional[str] = None
+    session_id: Optional[str] = None
+    usage: Optional[dict] = None
+
+class BatchDialogueRequest(BaseModel):
+    items: List[DialogueRequest]
+    concurrency: Optional[int] = None
+    stream: bool = False
+
+class BatchItemResult(BaseModel):
+    index: int
+    result: Optional[DialogueResponse] = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+def observe_analysis(timings, waited: float):
+    if waited:
+        ANALYSIS_QUEUE_SECONDS.observe(waited)
+        observe_stage('analysis_queue', waited)
+    for stage, seconds in (timings or {}).items():
+        observe_stage(stage, seconds)
+
+async def analyze_message(message: str, fields: Optional[List[str]] = None):
+    """
+    Run NLP processing and categorization for a single message in the
+    analysis pool. Only the fields the pipeline needs are computed, plus
+    any extra `fields` the client asked for (e.g. pos_tags).
+    """
+    try:
+        analysis, timings, waited = await analysis_pool.analyze(message, PIPELINE_FIELDS + tuple(fields or ()))
+    except AnalysisQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    observe_analysis(timings, waited)
+    return analysis
+
+async def analyze_messages(messages: List[str], fields: Optional[List[Optional[List[str]]]] = None):
+    """
+    Batch form of analyze_message; `fields` holds the extra fields per
+    message. Returns one (processed_input, category, category_description)
+    tuple per message, or the exception raised for it.
+    """
+    fields = [PIPELINE_FIELDS + tuple(f or ()) for f in (fields or [None] * len(messages))]
+    try:
+        results, waited = await analysis_pool.analyze_many(messages, fields)
+    except AnalysisQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    observe_analysis(None, waited)
+    analyses = []
+    for result in results:
+        if isinstance(result, ValueError):
+            analyses.append(HTTPException(status_code=400, detail=str(result)))
+        elif isinstance(result, Exception):
+            analyses.append(result)
+        else:
+            analysis, timings = result
+            observe_analysis(timings, 0.0)
+            analyses.append(analysis)
+    return analyses
+
+async def resolve_session(request: DialogueRequest):
+    """
+    Return (session, context) for a request. With a session id (or
+    new_session) the context comes from the server-side session; otherwise
+    the client-supplied context is used as-is.
+    """
+    if not request.session_id and not request.new_session:
+        return None, request.context
+    session = await session_store.get_or_create_async(request.session_id)
+    return session, session.render_context() or None
+
+async def record_turn(session, message: str, processed_input: dict, response: str):
+    if session is not None:
+        session.add_turn(message, response, processed_input['filtered_tokens'])
+        await session_store.save_async(session)
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.post("/api/dialogue")
 async def create_dialogue(request: DialogueRequest):
     try:
-        processed_input = nlp_processor.process(request.message)
-        
-        # Categorize the input if categorizer is available
-        category = None
-        category_description = None
-        if categorizer:
-            try:
-                category, _ = categorizer.predict(request.message)
-                category_description = categorizer.get_category_description(category)
-            except Exception as e:
-                print(f"Categorization failed: {e}")
+        processed_input, category, category_description = await analyze_message(request.message, request.analysis_fields)
+        session, context = await resolve_session(request)
+        usage = {}
         
         response = await socratic_dialogue.generate_response(
             request.message, 
             processed_input,
-            request.context,
+            context,
             category,
-            category_description
+            category_description,
+            use_cache=not request.bypass_cache,
+            usage=usage
         )
+        await record_turn(session, request.message, processed_input, response)
         
         return DialogueResponse(
             response=response,
             processed_input=processed_input,
             category=category,
-            category_description=category_description
+            category_description=category_description,
+            session_id=session.id if session else None,
+            usage=usage
         )
+    except HTTPException as e:
+        REQUEST_ERRORS.inc(route='/api/dialogue', status=e.status_code)
+        raise
     except Exception as e:
+        REQUEST_ERRORS.inc(route='/api/dialogue', status=500)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/dialogue/stream")
+async def stream_dialogue(request: DialogueRequest):
+    """
+    Server-Sent Events variant of /api/dialogue. Emits one `metadata` event with the
+    input analysis, then `token` events as the LLM produces text, then `done`
+    (or `error` if generation fails part-way).
+    """
+    try:
+        processed_input, category, category_description = await analyze_message(request.message, request.analysis_fields)
+        session, context = await resolve_session(request)
+    except HTTPException as e:
+        REQUEST_ERRORS.inc(route='/api/dialogue/stream', status=e.status_code)
+        raise
+    except Exception as e:
+        REQUEST_ERRORS.inc(route='/api/dialogue/stream', status=500)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def event_stream():
+        yield sse_event("metadata", {
+            "processed_input": processed_input,
+            "category": category,
+            "category_description": category_description,
+            "session_id": session.id if session else None
+        })
+        chunks = []
+        usage = {}
+        try:
+            async for chunk in socratic_dialogue.stream_response(
+                request.message,
+                processed_input,
+                context,
+                category,
+                category_description,
+                use_cache=not request.bypass_cache,
+                usage=usage
+            ):
+                chunks.append(chunk)
+                yield sse_event("token", {"text": chunk})
+        except HTTPException as e:
+            # The 200 status is already sent; count the failure as the error event reports it
+            REQUEST_ERRORS.inc(route='/api/dialogue/stream', status=e.status_code)
+            yield sse_event("error", {
+                "status_code": e.status_code,
+                "detail": e.detail,
+                "retry_after": (e.headers or {}).get("Retry-After")
+            })
+            return
+        except Exception as e:
+            REQUEST_ERRORS.inc(route='/api/dialogue/stream', status=500)
+            yield sse_event("error", {"status_code": 500, "detail": str(e)})
+            return
+        await record_turn(session, request.message, processed_input, ''.join(chunks))
+        yield sse_event("done", {"usage": usage})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/dialogue/batch")
+async def batch_dialogue(request: BatchDialogueRequest):
+    """
+    Run many dialogue requests through the same pipeline as /api/dialogue.
+    Analysis runs over the whole batch up front; LLM calls run with at most
+    `concurrency` (capped by BATCH_CONCURRENCY) in flight. Each item gets its
+    own result or error. With `stream` set, results are sent as NDJSON lines
+    in completion order; otherwise a list in request order is returned.
+    """
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(request.items)} items (max {BATCH_MAX_ITEMS})"
+        )
+    
+    concurrency = min(request.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    analyses = await analyze_messages(
+        [item.message for item in request.items],
+        [item.analysis_fields for item in request.items]
+    )
+    
+    async def run_item(index: int, item: DialogueRequest, analysis) -> BatchItemResult:
+        if isinstance(analysis, HTTPException):
+            return BatchItemResult(index=index, error=str(analysis.detail), status_code=analysis.status_code)
+        if isinstance(analysis, Exception):
+            return BatchItemResult(index=index, error=str(analysis), status_code=500)
+        processed_input, category, category_description = analysis
+        try:
+            session, context = await resolve_session(item)
+            usage = {}
+            async with semaphore:
+                response = await socratic_dialogue.generate_response(
+                    item.message,
+                    processed_input,
+                    context,
+                    category,
+                    category_description,
+                    use_cache=not item.bypass_cache,
+                    usage=usage
+                )
+            await record_turn(session, item.message, processed_input, response)
+        except HTTPException as e:
+            return BatchItemResult(index=index, error=str(e.detail), status_code=e.status_code)
+        except Exception as e:
+            return BatchItemResult(index=index, error=str(e), status_code=500)
+        
+        return BatchItemResult(
+            index=index,
+            result=DialogueResponse(
+                response=response,
+                processed_input=processed_input,
+                category=category,
+                category_description=category_description,
+                session_id=session.id if session else None,
+                usage=usage
+            ),
+            status_code=200
+        )
+    
+    tasks = [
+        asyncio.ensure_future(run_item(index, item, analysis))
+        for index, (item, analysis) in enumerate(zip(request.items, analyses))
+    ]
+    
+    if not request.stream:
+        return await asyncio.gather(*tasks)
+    
+    async def ndjson_stream():
+        try:
+            for finished in asyncio.as_completed(tasks):
+                item_result = await finished
+                yield item_result.model_dump_json() + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
 @app.post("/dialogue", response_class=HTMLResponse)
 async def dialogue_form(request: Request, message: str = Form(...)):
     try:
-        processed_input = nlp_processor.process(message)
-        
-        # Categorize the input if categorizer is available
-        category = None
-        category_description = None
-        if categorizer:
-            try:
-                category, _ = categorizer.predict(message)
-                category_description = categorizer.get_category_description(category)
-            except Exception as e:
-                print(f"Categorization failed: {e}")
+        processed_input, category, category_description = await analyze_message(message)
         
         response = await socratic_dialogue.generate_response(
             message, 
@@ -112,6 +455,7 @@ async def dialogue_form(request: Request, message: str = Form(...)):
             "category_description": category_description
         })
     except Exception as e:
+        REQUEST_ERRORS.inc(route='/dialogue', status=getattr(e, 'status_code', 500))
         return templates.TemplateResponse("index.html", {
             "request": request,
             "error": str(e)
@@ -119,4 +463,20 @@ async def dialogue_form(request: Request, message: str = Form(...)):
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/stats")
+async def stats():
+    return {
+        "response_cache": llm_service.cache.stats() if llm_service.cache else None,
+        "single_flight": llm_service.in_flight.stats(),
+        "llm_providers": llm_service.provider_stats(),
+        "sessions": session_store.stats(),
+        "nlp": nlp_processor.stats(),
+        "categorizer": {"state": categorizer_state, "mode": categorizer_mode, **(categorizer.load_stats if categorizer else {})},
+        "analysis": analysis_pool.stats()
+    }
\ No newline at end of file
@@ -1,13 +1,32 @@
 import pickle
 import os
-from typing import List, Tuple, Dict
+import time
+from itertools import islice
+from typing import Any, Iterable, List, Tuple, Dict, Union
 import numpy as np
+import sklearn
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, accuracy_score
-import re
-import string
+
+from app.categorizer_features import PhilosophicalFeatures
+from app.model_artifact import ArtifactError, TreePredictor, current_rss_bytes, read_artifact, write_artifact
+from app.text_analysis import KEYWORD_MATCHER, AnalyzedText, KeywordMatcher, analyze_text
+
+# Texts vectorized and classified per call in predict_batch; bounds the size
+# of the intermediate sparse matrix for very large inputs
+PREDICT_BATCH_SIZE = 10000
+
+MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'models'))
+DEFAULT_ARTIFACT_PATH = os.path.join(MODELS_DIR, 'philosophy_categorizer.model')
+
+# TfidfVectorizer settings stored in the model artifact; anything else
+# (a custom tokenizer or preprocessor) cannot be stored and is rejected
+VECTORIZER_SETTINGS = (
+    'lowercase', 'strip_accents', 'stop_words', 'token_pattern', 'ngram_range', 'analyzer',
+    'binary', 'norm', 'use_idf', 'smooth_idf', 'sublinear_tf'
+)
 
 class PhilosophicalCategorizer:
     """
@@ -16,8 +35,13 @@ class PhilosophicalCategorizer:
     """
     
     def __init__(self):
+        # The fitted DecisionTreeClassifier; only set after training or loading legacy pickles
         self.model = None
-        self.vectorizer = None
+        # The tree as flat arrays, used for all predictions
+        self.tree = None
+        # TF-IDF plus keyword features, as one sparse matrix
+        self.features = None
+        self.load_stats: Dict[str, Any] = {}
         self.categories = [
             'ethics',           # Questions about right/wrong, morality
             'metaphysics',      # Questions about reality, existence, being
@@ -30,46 +54,19 @@ class PhilosophicalCategorizer:
             'religion',         # Questions about God, faith, spirituality
             'general'           # General philosophical inquiries
         ]
-        self.model_path = 'models/philosophy_categorizer.pkl'
-        self.vectorizer_path = 'models/tfidf_vectorizer.pkl'
-        
-    def preprocess_text(self, text: str) -> str:
-        """Preprocess text for better feature extraction."""
-        # Convert to lowercase
-        text = text.lower()
-        
-        # Remove punctuation
-        text = text.translate(str.maketrans('', '', string.punctuation))
+        self.artifact_path = os.getenv('CATEGORIZER_MODEL_PATH', DEFAULT_ARTIFACT_PATH)
+        # Pickles written by older versions; still loaded when there is no
+        # artifact at the default path (never in place of an explicit CATEGORIZER_MODEL_PATH)
+        self.model_path = os.path.join(MODELS_DIR, 'philosophy_categorizer.pkl')
+        self.vectorizer_path = os.path.join(MODELS_DIR, 'tfidf_vectorizer.pkl')
         
-        # Remove extra whitespace
-        text = ' '.join(text.split())
-        
-        return text
+    def preprocess_text(self, text: Union[str, AnalyzedText]) -> str:
+        """Preprocess text for better feature extraction: lowercase, no punctuation, single spaces."""
+        return analyze_text(text).normalized
     
-    def extract_keywords(self, text: str) -> List[str]:
+    def extract_keywords(self, text: Union[str, AnalyzedText]) -> List[str]:
         """Extract philosophical keywords from text."""
-        keywords = {
-            'ethics': ['moral', 'ethics', 'right', 'wrong', 'good', 'evil', 'virtue', 'duty', 'obligation', 'should', 'ought'],
-            'metaphysics': ['exist', 'reality', 'being', 'essence', 'substance', 'universe', 'time', 'space', 'cause', 'effect'],
-            'epistemology': ['know', 'knowledge', 'truth', 'belief', 'certain', 'doubt', 'evidence', 'proof', 'rational', 'reason'],
-            'logic': ['logic', 'argument', 'premise', 'conclusion', 'valid', 'fallacy', 'inference', 'deduce', 'infer'],
-            'aesthetics': ['beauty', 'art', 'aesthetic', 'taste', 'sublime', 'ugly', 'creative', 'expression', 'style'],
-            'political': ['justice', 'society', 'government', 'rights', 'freedom', 'equality', 'democracy', 'power', 'law'],
-            'mind': ['mind', 'consciousness', 'thought', 'perception', 'awareness', 'mental', 'cognitive', 'brain', 'soul'],
-            'language': ['meaning', 'language', 'word', 'communication', 'semantics', 'syntax', 'reference', 'sign', 'symbol'],
-            'religion': ['god', 'divine', 'faith', 'religion', 'spiritual', 'sacred', 'holy', 'afterlife', 'soul', 'prayer']
-        }
-        
-        found_keywords = []
-        text_lower = text.lower()
-        
-        for category, words in keywords.items():
-            for word in words:
-                if word in text_lower:
-                    found_keywords.append(f"has_{category}_keyword")
-                    break
-        
-        return found_keywords
+        return [f"has_{category}_keyword" for category in analyze_text(text).keyword_categories]
     
     def create_training_data(self) -> Tuple[List[str], List[str]]:
         """Create training data for the model."""
@@ -163,27 +160,13 @@ class PhilosophicalCategorizer:
         # Get training data
         texts, labels = self.create_training_data()
         
-        # Preprocess texts
-        processed_texts = [self.preprocess_text(text) for text in texts]
-        
-        # Create TF-IDF features
-        self.vectorizer = TfidfVectorizer(max_features=100, ngram_range=(1, 2))
-        X = self.vectorizer.fit_transform(processed_texts)
-        
-        # Add keyword features
-        keyword_features = []
-        for text in texts:
-            keywords = self.extract_keywords(text)
-            keyword_vector = [1 if f"has_{cat}_keyword" in keywords else 0 
-                            for cat in self.categories[:-1]]  # Exclude 'general'
-            keyword_features.append(keyword_vector)
-        
-        keyword_features = np.array(keyword_features)
-        X_combined = np.hstack([X.toarray(), keyword_features])
+        # Create TF-IDF and keyword features (sparse)
+        self.features = PhilosophicalFeatures(self.categories[:-1], max_features=100, ngram_range=(1, 2))
+        X = self.features.fit_transform(texts)
         
         # Split data
         X_train, X_test, y_train, y_test = train_test_split(
-            X_combined, labels, test_size=0.2, random_state=42, stratify=labels
+            X, labels, test_size=0.2, random_state=42, stratify=labels
         )
         
         # Train decision tree
@@ -194,6 +177,7 @@ class PhilosophicalCategorizer:
             random_state=42
         )
         self.model.fit(X_train, y_train)
+        self.tree = TreePredictor.from_sklearn(self.model)
         
         # Evaluate
         y_pred = self.model.predict(X_test)
@@ -206,62 +190,177 @@ class PhilosophicalCategorizer:
         self.save_model()
     
     def save_model(self):
-        """Save the trained model and vectorizer."""
-        os.makedirs('models', exist_ok=True)
+        """Save the trained model as a single versioned artifact (see app/model_artifact.py)."""
+        vectorizer = self.features.vectorizer
+        params = vectorizer.get_params()
+        if params['tokenizer'] is not None or params['preprocessor'] is not None or not isinstance(params['analyzer'], str):
+            raise ValueError("A vectorizer with a custom tokenizer, preprocessor or analyzer cannot be saved")
+        settings = {name: params[name] for name in VECTORIZER_SETTINGS}
+        settings['ngram_range'] = list(settings['ngram_range'])
+        settings['dtype'] = np.dtype(params['dtype']).name
         
-        with open(self.model_path, 'wb') as f:
-            pickle.dump(self.model, f)
+        # Vocabulary as newline-separated UTF-8 in column order: one split()
+        # rebuilds it. The vectorizer folds all whitespace in terms to spaces
+        terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        if any('\n' in term for term in terms):
+            raise ValueError("Vocabulary terms cannot contain newlines")
         
-        with open(self.vectorizer_path, 'wb') as f:
-            pickle.dump(self.vectorizer, f)
+        metadata = {
+            'categories': self.categories,
+            'keyword_categories': list(self.features.keyword_categories),
+            'lexicon': self.features.lexicon,
+            'vectorizer': settings,
+            'classes': [str(label) for label in self.tree.classes],
+            'n_features': self.tree.n_features
+        }
+        arrays = {
+            'vocabulary': np.frombuffer('\n'.join(terms).encode('utf-8'), dtype=np.uint8),
+            'idf': np.asarray(vectorizer.idf_, dtype=np.float64),
+            **self.tree.arrays()
+        }
+        header = write_artifact(self.artifact_path, metadata, arrays)
         
-        print(f"Model saved to {self.model_path}")
-        print(f"Vectorizer saved to {self.vectorizer_path}")
+        print(f"Model saved to {self.artifact_path} (format v{header['format_version']}, "
+              f"sklearn {header['sklearn_version']}, sha256 {header['sha256'][:12]})")
     
     def load_model(self):
-        """Load the trained model and vectorizer."""
-        if os.path.exists(self.model_path) and os.path.exists(self.vectorizer_path):
-            with open(self.model_path, 'rb') as f:
-                self.model = pickle.load(f)
-            
-            with open(self.vectorizer_path, 'rb') as f:
-                self.vectorizer = pickle.load(f)
-            
-            return True
-        return False
-    
-    def predict(self, text: str) -> Tuple[str, Dict[str, float]]:
         """
-        Predict the philosophical category of a given text.
-        Returns the predicted category and confidence scores.
+        Load the model artifact, or, when the default path has none, the
+        pickles of older versions. Returns False if neither exists; raises
+        ArtifactError if the artifact is corrupt or of an unsupported format.
+        Records load time and process RSS in load_stats.
         """
-        if self.model is None or self.vectorizer is None:
-            if not self.load_model():
-                raise ValueError("Model not found. Please train the model first.")
+        started = time.perf_counter()
+        rss_before = current_rss_bytes()
+        if os.path.exists(self.artifact_path):
+            verify = os.getenv('CATEGORIZER_VERIFY_CHECKSUM', 'true').lower() == 'true'
+            header = self._load_artifact(verify)
+            stats = {
+                'source': 'artifact',
+                'path': self.artifact_path,
+                'format_version': header['format_version'],
+                'sklearn_version': header['sklearn_version'],
+                'bytes': os.path.getsize(self.artifact_path)
+            }
+        elif self.uses_default_path and os.path.exists(self.model_path) and os.path.exists(self.vectorizer_path):
+            self._load_pickles()
+            stats = {'source': 'pickle', 'path': self.model_path}
+        else:
+            return False
         
-        # Preprocess text
-        processed_text = self.preprocess_text(text)
-        
-        # Create features
-        X_tfidf = self.vectorizer.transform([processed_text])
+        rss = current_rss_bytes()
+        stats.update({
+            'load_ms': round((time.perf_counter() - started) * 1000, 2),
+            'rss_mb': round(rss / 2**20, 1),
+            'rss_delta_mb': round((rss - rss_before) / 2**20, 2),
+            'pid': os.getpid()
+        })
+        self.load_stats = stats
+        return True
+    
+    @property
+    def uses_default_path(self) -> bool:
+        return os.path.abspath(self.artifact_path) == DEFAULT_ARTIFACT_PATH
+    
+    def _load_artifact(self, verify: bool) -> Dict:
+        header, arrays = read_artifact(self.artifact_path, verify=verify)
+        try:
+            self._build_from_artifact(header, arrays)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise ArtifactError(f"Corrupt model data in {self.artifact_path}: {type(e).__name__}: {e}")
+        return header
+    
+    def _build_from_artifact(self, header: Dict, arrays: Dict):
+        metadata = header['metadata']
+        if header['sklearn_version'] != sklearn.__version__:
+            print(f"Warning: categorizer artifact was built with scikit-learn {header['sklearn_version']}, "
+                  f"running {sklearn.__version__}; TF-IDF tokenization may differ")
         
-        # Extract keyword features
-        keywords = self.extract_keywords(text)
-        keyword_vector = [1 if f"has_{cat}_keyword" in keywords else 0 
-                         for cat in self.categories[:-1]]
+        terms = str(arrays['vocabulary'].data, 'utf-8').split('\n')
+        settings = dict(metadata['vectorizer'])
+        settings['ngram_range'] = tuple(settings['ngram_range'])
+        settings['dtype'] = np.dtype(settings['dtype']).type
+        # Fitted state as fit() leaves it; passing vocabulary= instead would
+        # copy and re-validate the whole dict
+        vectorizer = TfidfVectorizer(**settings)
+        vectorizer.vocabulary_ = dict(zip(terms, range(len(terms))))
+        vectorizer.idf_ = arrays['idf']
         
-        # Combine features
-        X_combined = np.hstack([X_tfidf.toarray(), [keyword_vector]])
+        features = PhilosophicalFeatures(
+            metadata['keyword_categories'],
+            vectorizer=vectorizer,
+            # None: the shared lexicon, whose matches every AnalyzedText already caches
+            keyword_matcher=None if metadata['lexicon'] == KEYWORD_MATCHER.lexicon else KeywordMatcher(metadata['lexicon'])
+        )
+        tree = TreePredictor(
+            *(arrays[name] for name in TreePredictor.ARRAYS),
+            classes=metadata['classes'],
+            n_features=metadata['n_features']
+        )
+        # Only replace the current model once everything has been read
+        self.categories = metadata['categories']
+        self.features = features
+        self.tree = tree
+        self.model = None
+    
+    def _load_pickles(self):
+        with open(self.model_path, 'rb') as f:
+            self.model = pickle.load(f)
         
-        # Get prediction
-        prediction = self.model.predict(X_combined)[0]
+        with open(self.vectorizer_path, 'rb') as f:
+            features = pickle.load(f)
         
-        # Get probability scores (for decision trees, we'll use the decision path)
-        # For a more sophisticated approach, we could use predict_proba with a different model
-        confidence_scores = {cat: 0.0 for cat in self.categories}
-        confidence_scores[prediction] = 1.0
+        # Older models pickled the bare TfidfVectorizer; the column layout is the same
+        if isinstance(features, TfidfVectorizer):
+            features = PhilosophicalFeatures.from_vectorizer(features, self.categories[:-1])
+        self.features = features
+        self.tree = TreePredictor.from_sklearn(self.model)
+    
+    def _ensure_model(self):
+        if self.tree is None or self.features is None:
+            if not self.load_model():
+                raise ValueError("Model not found. Please train the model first.")
+    
+    def predict(self, text: Union[str, AnalyzedText]) -> Tuple[str, Dict[str, float]]:
+        """
+        Predict the philosophical category of a given text.
+        Returns the predicted category and confidence scores.
+        Pass an AnalyzedText to reuse normalization done for NLPProcessor.
+        """
+        return self.predict_batch([text])[0]
+    
+    def predict_batch(
+        self,
+        texts: Iterable[Union[str, AnalyzedText]],
+        batch_size: int = PREDICT_BATCH_SIZE
+    ) -> List[Tuple[str, Dict[str, float]]]:
+        """
+        predict() for many texts: each run of `batch_size` texts is vectorized
+        and classified in single vectorized calls. Returns the same
+        (category, confidence scores) pairs as predict, in order.
+        """
+        self._ensure_model()
         
-        return prediction, confidence_scores
+        results = []
+        texts = iter(texts)
+        while True:
+            batch = list(islice(texts, batch_size))
+            if not batch:
+                return results
+            
+            # Create TF-IDF and keyword features (sparse)
+            X = self.features.transform(batch)
+            
+            # Get predictions
+            predictions = self.tree.predict(X)
+            
+            # Get probability scores (for decision trees, we'll use the decision path)
+            # For a more sophisticated approach, we could use predict_proba with a different model
+            zero_scores = dict.fromkeys(self.categories, 0.0)
+            for prediction in predictions:
+                confidence_scores = zero_scores.copy()
+                confidence_scores[prediction] = 1.0
+                results.append((prediction, confidence_scores))
     
     def get_category_description(self, category: str) -> str:
         """Get a description of the philosophical category."""
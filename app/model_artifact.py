@@ -0,0 +1,239 @@
+"""
+Single-file, versioned model artifact for PhilosophicalCategorizer, and a
+numpy decision-tree predictor that reads its arrays.
+
+Layout (all integers little-endian):
+
+    8 bytes   MAGIC
+    4 bytes   header length N
+    N bytes   header, UTF-8 JSON: format_version, sklearn_version, sha256,
+              metadata (categories, vectorizer settings, keyword lexicon, ...)
+              and the dtype/shape/offset of every array
+    padding   to a 64-byte boundary
+    data      the raw arrays, each starting on a 64-byte boundary
+
+The data section is memory-mapped read-only and the arrays are numpy views
+into the mapping, so loading costs almost nothing and every worker process
+on the machine shares the same physical pages instead of each holding an
+unpickled copy. The sha256 covers the metadata and the data section.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Tuple
+
+import numpy as np
+from scipy import sparse
+
+MAGIC = b'SOCRAT\x00\x01'
+FORMAT_VERSION = 1
+ALIGN = 64
+
+
+class ArtifactError(Exception):
+    """Raised when a model artifact is missing, corrupt or of an unsupported version."""
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _padding(offset: int) -> int:
+    return -offset % ALIGN
+
+
+def _checksum(metadata: Dict, data) -> str:
+    digest = hashlib.sha256(json.dumps(metadata, sort_keys=True).encode('utf-8'))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def write_artifact(path: str, metadata: Dict, arrays: Dict[str, np.ndarray]) -> Dict:
+    """Write metadata and arrays to `path` atomically; returns the header."""
+    import sklearn
+
+    layout = {}
+    blobs = []
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        if array.dtype.hasobject:
+            raise ValueError(f"Array {name} has dtype object and cannot be stored")
+        offset += _padding(offset)
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset, 'nbytes': array.nbytes}
+        blobs.append((offset, array.tobytes()))
+        offset += array.nbytes
+    data = bytearray(offset)
+    for start, blob in blobs:
+        data[start:start + len(blob)] = blob
+
+    header = {
+        'format_version': FORMAT_VERSION,
+        'sklearn_version': sklearn.__version__,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'sha256': _checksum(metadata, data),
+        'metadata': metadata,
+        'arrays': layout
+    }
+    encoded = json.dumps(header, sort_keys=True).encode('utf-8')
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f"{path}.tmp{os.getpid()}"
+    with open(temp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(encoded)))
+        f.write(encoded)
+        f.write(b'\0' * _padding(len(MAGIC) + 4 + len(encoded)))
+        f.write(data)
+    os.replace(temp_path, path)
+    return header
+
+
+def read_artifact(path: str, verify: bool = True) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """
+    Map the artifact at `path`; returns (header, arrays). The arrays are
+    read-only views into the shared mapping. `verify` checks the sha256.
+    """
+    try:
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        raise ArtifactError(f"Cannot map {path}: {e}")
+
+    if mapped[:len(MAGIC)] != MAGIC:
+        raise ArtifactError(f"{path} is not a model artifact")
+    if len(mapped) < len(MAGIC) + 4:
+        raise ArtifactError(f"{path} is truncated (no header length)")
+    (header_length,) = struct.unpack_from('<I', mapped, len(MAGIC))
+    header_end = len(MAGIC) + 4 + header_length
+    if header_end > len(mapped):
+        raise ArtifactError(f"{path} is truncated: header needs {header_end} bytes, file has {len(mapped)}")
+    try:
+        header = json.loads(bytes(mapped[len(MAGIC) + 4:header_end]).decode('utf-8'))
+    except ValueError as e:
+        raise ArtifactError(f"Corrupt header in {path}: {e}")
+    if not isinstance(header, dict):
+        raise ArtifactError(f"Corrupt header in {path}: not an object")
+    if header.get('format_version') != FORMAT_VERSION:
+        raise ArtifactError(
+            f"{path} has format version {header.get('format_version')}, this build reads {FORMAT_VERSION}"
+        )
+
+    data_start = header_end + _padding(header_end)
+    data = memoryview(mapped)[data_start:]
+    try:
+        if verify and _checksum(header['metadata'], data) != header['sha256']:
+            raise ArtifactError(f"Checksum mismatch for {path}")
+
+        arrays = {}
+        for name, entry in header['arrays'].items():
+            dtype = np.dtype(entry['dtype'])
+            offset, nbytes, shape = entry['offset'], entry['nbytes'], tuple(entry['shape'])
+            if offset < 0 or offset + nbytes > len(data):
+                raise ArtifactError(
+                    f"{path} is truncated: array {name} needs bytes {offset}-{offset + nbytes} "
+                    f"of a {len(data)}-byte data section"
+                )
+            if int(np.prod(shape, dtype=np.int64)) * dtype.itemsize != nbytes:
+                raise ArtifactError(f"Corrupt header in {path}: array {name} shape {list(shape)} does not match {nbytes} bytes")
+            arrays[name] = np.frombuffer(mapped, dtype=dtype, count=nbytes // dtype.itemsize, offset=data_start + offset).reshape(shape)
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        raise ArtifactError(f"Corrupt header in {path}: {type(e).__name__}: {e}")
+    return header, arrays
+
+
+class TreePredictor:
+    """
+    Predicts with a fitted decision tree held as flat numpy arrays, so the
+    model needs neither unpickling nor scikit-learn's Tree object. Gives
+    the same labels as DecisionTreeClassifier.predict.
+    """
+
+    ARRAYS = ('children_left', 'children_right', 'feature', 'threshold', 'leaf_class')
+
+    def __init__(self, children_left, children_right, feature, threshold, leaf_class, classes, n_features: int):
+        self.children_left = children_left
+        self.children_right = children_right
+        self.feature = feature
+        self.threshold = threshold
+        self.leaf_class = leaf_class
+        self.classes = np.asarray(classes)
+        self.n_features = n_features
+
+    @classmethod
+    def from_sklearn(cls, model) -> "TreePredictor":
+        tree = model.tree_
+        return cls(
+            tree.children_left.astype(np.int32),
+            tree.children_right.astype(np.int32),
+            tree.feature.astype(np.int32),
+            tree.threshold.astype(np.float64),
+            # Majority class per node, as DecisionTreeClassifier.predict takes it
+            tree.value[:, 0, :].argmax(axis=1).astype(np.int32),
+            model.classes_,
+            int(model.n_features_in_)
+        )
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    def predict(self, X: sparse.csr_matrix) -> np.ndarray:
+        """Class labels for the rows of a CSR matrix."""
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, but the model expects {self.n_features}")
+        if X.format != 'csr':
+            X = X.tocsr()
+        if X.shape[0] == 1:
+            return self.classes[[self._predict_row(X.indices, X.data)]]
+
+        if not X.has_sorted_indices:
+            X = X.sorted_indices()
+        n_rows, n_columns = X.shape
+        # Each stored value keyed by row * n_columns + column; sorted, since
+        # rows are consecutive and indices sorted within a row
+        keys = np.repeat(np.arange(n_rows, dtype=np.int64), np.diff(X.indptr)) * n_columns + X.indices
+        values = X.data.astype(np.float32, copy=False)
+
+        nodes = np.zeros(n_rows, dtype=np.int64)
+        active = np.arange(n_rows)
+        while active.size:
+            node = nodes[active]
+            internal = self.children_left[node] != -1
+            active, node = active[internal], node[internal]
+            if not active.size:
+                break
+            query = active * n_columns + self.feature[node]
+            found = np.zeros(len(query), dtype=bool)
+            value = np.zeros(len(query), dtype=np.float32)
+            if len(keys):
+                position = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+                found = keys[position] == query
+                value = np.where(found, values[position], np.float32(0))
+            go_left = value <= self.threshold[node]
+            nodes[active] = np.where(go_left, self.children_left[node], self.children_right[node])
+        return self.classes[self.leaf_class[nodes]]
+
+    def _predict_row(self, indices, data) -> int:
+        # One message (the request path): a plain walk beats numpy's per-call overhead
+        row = dict(zip(indices.tolist(), np.asarray(data, dtype=np.float32).tolist()))
+        children_left, children_right = self.children_left, self.children_right
+        feature, threshold = self.feature, self.threshold
+        node = 0
+        while children_left[node] != -1:
+            if row.get(int(feature[node]), 0.0) <= threshold[node]:
+                node = children_left[node]
+            else:
+                node = children_right[node]
+        return int(self.leaf_class[node])
@@ -0,0 +1,100 @@
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class ProviderStats:
+    """
+    Rolling latency and error statistics for one LLM provider, used to rank
+    providers for failover and to decide when a request should be hedged.
+
+    A demoted provider gets little or no traffic, so its statistics would
+    never change: the error rate also halves every `error_half_life`
+    seconds, and latency samples older than `stale_after` seconds are
+    dropped on the next call, so the provider is tried again and re-measured.
+    """
+
+    def __init__(self, name: str, window: int = 200, error_decay: float = 0.1,
+                 error_half_life: float = 60.0, stale_after: float = 300.0):
+        self.name = name
+        self.latencies = deque(maxlen=window)
+        self.error_decay = error_decay
+        self.error_half_life = error_half_life
+        self.stale_after = stale_after
+        self._error_rate = 0.0
+        self._error_rate_at = time.time()
+        self.last_call_at: Optional[float] = None
+        self.successes = 0
+        self.errors = 0
+        self.rate_limits = 0
+        self.last_error_at: Optional[float] = None
+        self.input_tokens = 0
+        self.cached_input_tokens = 0
+        self.output_tokens = 0
+
+    def _error_rate_now(self, now: float) -> float:
+        if self.error_half_life <= 0:
+            return self._error_rate
+        return self._error_rate * 0.5 ** ((now - self._error_rate_at) / self.error_half_life)
+
+    @property
+    def error_rate(self) -> float:
+        return self._error_rate_now(time.time())
+
+    def latencies_stale(self, now: Optional[float] = None) -> bool:
+        """True when the provider has not been called for `stale_after` seconds."""
+        if self.last_call_at is None or self.stale_after <= 0:
+            return False
+        return (now or time.time()) - self.last_call_at > self.stale_after
+
+    def _record_call(self, error: bool) -> float:
+        now = time.time()
+        if self.latencies_stale(now):
+            self.latencies.clear()
+        self.last_call_at = now
+        self._error_rate = self._error_rate_now(now) * (1 - self.error_decay) + (self.error_decay if error else 0.0)
+        self._error_rate_at = now
+        return now
+
+    def record_success(self, latency: float):
+        self._record_call(error=False)
+        self.latencies.append(latency)
+        self.successes += 1
+
+    def record_error(self, rate_limited: bool = False):
+        self.last_error_at = self._record_call(error=True)
+        self.errors += 1
+        if rate_limited:
+            self.rate_limits += 1
+
+    def record_usage(self, usage: Dict[str, int]):
+        self.input_tokens += usage.get('input_tokens', 0)
+        self.cached_input_tokens += usage.get('cached_input_tokens', 0)
+        self.output_tokens += usage.get('output_tokens', 0)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies or self.latencies_stale():
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def score(self) -> float:
+        """Expected cost of routing a request here; lower is better."""
+        median = self.percentile(50) or 0.0
+        return median * (1 + self.error_rate)
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            'successes': self.successes,
+            'errors': self.errors,
+            'rate_limits': self.rate_limits,
+            'error_rate': round(self.error_rate, 4),
+            'last_error_at': self.last_error_at,
+            'p50_latency': self.percentile(50),
+            'p95_latency': self.percentile(95),
+            'samples': len(self.latencies),
+            'input_tokens': self.input_tokens,
+            'cached_input_tokens': self.cached_input_tokens,
+            'output_tokens': self.output_tokens
+        }
@@ -0,0 +1,153 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted to a provider in time."""
+
+    def __init__(self, provider: str, retry_after: float, reason: str):
+        super().__init__(f"{provider}: {reason}")
+        self.provider = provider
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at rate_per_minute."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)."""
+        self._refill()
+        # A request larger than the bucket can only ever wait for a full bucket
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+
+class ProviderLimiter:
+    """Requests-per-minute and tokens-per-minute buckets for one provider."""
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+
+    @classmethod
+    def from_env(cls, provider: str) -> "ProviderLimiter":
+        prefix = provider.upper()
+        rpm = float(os.getenv(f'{prefix}_RPM', os.getenv('LLM_RPM', '0')))
+        tpm = float(os.getenv(f'{prefix}_TPM', os.getenv('LLM_TPM', '0')))
+        return cls(rpm, tpm)
+
+    def delay_for(self, tokens: float) -> float:
+        delays = [0.0]
+        if self.requests is not None:
+            delays.append(self.requests.delay_for(1))
+        if self.tokens is not None:
+            delays.append(self.tokens.delay_for(tokens))
+        return max(delays)
+
+    def take(self, tokens: float):
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+
+class AdmissionController:
+    """
+    Bounded admission queue in front of the per-provider limiters. A request
+    waits at most max_wait seconds for its provider's buckets; if the queue is
+    full or the wait would be longer, it is rejected immediately with a
+    retry-after hint instead of being sent upstream to be rate limited.
+    """
+
+    def __init__(self, limiters: Dict[str, ProviderLimiter], max_queue: int = 100, max_wait: float = 5.0):
+        self.limiters = limiters
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.waiting = 0
+        self.max_waiting_seen = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_times = deque(maxlen=500)
+
+    @classmethod
+    def from_env(cls, providers) -> "AdmissionController":
+        return cls(
+            {provider: ProviderLimiter.from_env(provider) for provider in providers},
+            max_queue=int(os.getenv('LLM_ADMISSION_QUEUE_SIZE', '100')),
+            max_wait=float(os.getenv('LLM_ADMISSION_MAX_WAIT', '5'))
+        )
+
+    async def acquire(self, provider: str, tokens: float):
+        limiter = self.limiters[provider]
+        delay = limiter.delay_for(tokens)
+        if delay == 0:
+            limiter.take(tokens)
+            self._admit(0.0)
+            return
+
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(provider, delay, "admission queue is full")
+        if delay > self.max_wait:
+            self.rejected += 1
+            raise AdmissionRejected(provider, delay, "provider rate limit reached")
+
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        self.waiting += 1
+        self.max_waiting_seen = max(self.max_waiting_seen, self.waiting)
+        try:
+            while delay > 0:
+                if time.monotonic() + delay > deadline:
+                    self.rejected += 1
+                    raise AdmissionRejected(provider, delay, "timed out waiting for provider capacity")
+                await asyncio.sleep(delay)
+                delay = limiter.delay_for(tokens)
+            limiter.take(tokens)
+        finally:
+            self.waiting -= 1
+        self._admit(time.monotonic() - started)
+
+    def _admit(self, waited: float):
+        self.admitted += 1
+        self.wait_times.append(waited)
+
+    def stats(self) -> Dict[str, float]:
+        waits = sorted(self.wait_times)
+
+        def percentile(p):
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(math.ceil(p / 100 * len(waits))) - 1)]
+
+        return {
+            'queue_depth': self.waiting,
+            'max_queue_depth_seen': self.max_waiting_seen,
+            'max_queue': self.max_queue,
+            'max_wait': self.max_wait,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'wait_p50': percentile(50),
+            'wait_p95': percentile(95)
+        }
@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class SQLiteCacheBackend:
+    """
+    Persistent cache tier backed by a single SQLite file, so cached responses
+    survive restarts and can be shared by workers on the same machine.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)")
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= time.time():
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            return row[0], row[1]
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM responses: a bounded in-memory LRU with TTL in front
+    of an optional persistent backend (anything with get/set/clear/purge_expired,
+    e.g. SQLiteCacheBackend). Code on the event loop uses get_async/set_async,
+    which run backend I/O in a worker thread.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, backend=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """Build the cache from RESPONSE_CACHE_* settings; None when disabled."""
+        max_entries = int(os.getenv('RESPONSE_CACHE_SIZE', '1024'))
+        if max_entries <= 0:
+            return None
+        ttl = float(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+        path = os.getenv('RESPONSE_CACHE_PATH')
+        backend = SQLiteCacheBackend(path) if path else None
+        return cls(max_entries=max_entries, ttl=ttl, backend=backend)
+
+    @staticmethod
+    def make_key(provider: str, model: str, temperature: float, prompt: str, system: str = '') -> str:
+        payload = json.dumps([provider, model, temperature, system, prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._get_memory(key)
+        if value is None and self.backend is not None:
+            value = self._backend_hit(key, self.backend.get(key))
+        if value is None:
+            self._miss()
+        return value
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """get() without blocking the event loop on the persistent tier."""
+        value = self._get_memory(key)
+        if value is None and self.backend is not None:
+            value = self._backend_hit(key, await asyncio.to_thread(self.backend.get, key))
+        if value is None:
+            self._miss()
+        return value
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+        return None
+
+    def _backend_hit(self, key: str, stored: Optional[Tuple[str, float]]) -> Optional[str]:
+        if stored is None:
+            return None
+        value, expires_at = stored
+        with self._lock:
+            self._store(key, value, expires_at)
+            self.hits += 1
+            self.backend_hits += 1
+        return value
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def set(self, key: str, value: str):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+        if self.backend is not None:
+            self.backend.set(key, value, expires_at)
+
+    async def set_async(self, key: str, value: str):
+        """set() without blocking the event loop on the persistent tier."""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+        if self.backend is not None:
+            await asyncio.to_thread(self.backend.set, key, value, expires_at)
+
+    def purge_expired(self) -> int:
+        """
+        Drop expired entries from both tiers; returns how many persistent rows
+        were removed. Expired rows are otherwise only deleted when read again.
+        """
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]:
+                del self._entries[key]
+        return self.backend.purge_expired() if self.backend is not None else 0
+
+    def _store(self, key: str, value: str, expires_at: float):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'backend_hits': self.backend_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'persistent': self.backend is not None
+            }
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Dict, List, Optional
+
+
+class Session:
+    """
+    Server-side conversation state. Only the last `window` turns are kept
+    verbatim; older turns are folded into a bounded summary of the concepts
+    discussed, so the context sent to the LLM stays the same size however
+    long the conversation gets.
+    """
+
+    MAX_SUMMARY_CONCEPTS = 12
+
+    def __init__(self, session_id: str, window: int = 4, max_turn_chars: int = 1000):
+        self.id = session_id
+        self.window = window
+        self.max_turn_chars = max_turn_chars
+        self.turns = deque()
+        self.concepts = Counter()
+        self.summarized_turns = 0
+        self.turn_count = 0
+        self.updated_at = time.time()
+
+    def add_turn(self, message: str, response: str, key_concepts: List[str]):
+        self.turns.append({
+            'message': message[:self.max_turn_chars],
+            'response': response[:self.max_turn_chars],
+            'concepts': key_concepts[:10]
+        })
+        self.turn_count += 1
+        self.updated_at = time.time()
+        while len(self.turns) > self.window:
+            self._summarize(self.turns.popleft())
+
+    def _summarize(self, turn: Dict):
+        self.summarized_turns += 1
+        self.concepts.update(concept.lower() for concept in turn['concepts'])
+        # Keep the counter bounded; rare concepts drop out of the summary
+        if len(self.concepts) > self.MAX_SUMMARY_CONCEPTS * 4:
+            self.concepts = Counter(dict(self.concepts.most_common(self.MAX_SUMMARY_CONCEPTS * 2)))
+
+    def summary(self) -> str:
+        if not self.summarized_turns:
+            return ""
+        concepts = ', '.join(c for c, _ in self.concepts.most_common(self.MAX_SUMMARY_CONCEPTS))
+        summary = f"{self.summarized_turns} earlier exchange(s)"
+        if concepts:
+            summary += f" touching on: {concepts}"
+        return summary
+
+    def render_context(self) -> str:
+        parts = []
+        summary = self.summary()
+        if summary:
+            parts.append(f"Earlier in this conversation: {summary}.")
+        for turn in self.turns:
+            parts.append(f"User: {turn['message']}\nSocrates: {turn['response']}")
+        return '\n'.join(parts)
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'window': self.window,
+            'max_turn_chars': self.max_turn_chars,
+            'turns': list(self.turns),
+            'concepts': dict(self.concepts),
+            'summarized_turns': self.summarized_turns,
+            'turn_count': self.turn_count,
+            'updated_at': self.updated_at
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Session":
+        session = cls(data['id'], data['window'], data['max_turn_chars'])
+        session.turns = deque(data['turns'])
+        session.concepts = Counter(data['concepts'])
+        session.summarized_turns = data['summarized_turns']
+        session.turn_count = data['turn_count']
+        session.updated_at = data['updated_at']
+        return session
+
+
+class SQLiteSessionBackend:
+    """Persistent session tier, so conversations survive restarts."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, session_id: str, data: Dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(data), data['updated_at'])
+            )
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def purge_idle(self, cutoff: float) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,)).rowcount
+
+
+class SessionStore:
+    """
+    In-memory LRU of sessions with idle expiry, in front of an optional
+    persistent backend (anything with get/set/delete/purge_idle, e.g.
+    SQLiteSessionBackend).
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        idle_ttl: float = 3600.0,
+        window: int = 4,
+        max_turn_chars: int = 1000,
+        backend=None
+    ):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.window = window
+        self.max_turn_chars = max_turn_chars
+        self.backend = backend
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        path = os.getenv('SESSION_STORE_PATH')
+        return cls(
+            max_sessions=int(os.getenv('SESSION_MAX_SESSIONS', '10000')),
+            idle_ttl=float(os.getenv('SESSION_IDLE_TTL', '3600')),
+            window=int(os.getenv('SESSION_WINDOW_TURNS', '4')),
+            max_turn_chars=int(os.getenv('SESSION_MAX_TURN_CHARS', '1000')),
+            backend=SQLiteSessionBackend(path) if path else None
+        )
+
+    def create(self) -> Session:
+        session = Session(secrets.token_urlsafe(16), self.window, self.max_turn_chars)
+        self.save(session)
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                if now - session.updated_at <= self.idle_ttl:
+                    self._sessions.move_to_end(session_id)
+                    return session
+                del self._sessions[session_id]
+                self.expirations += 1
+
+        if self.backend is not None:
+            data = self.backend.get(session_id)
+            if data is not None:
+                if now - data['updated_at'] > self.idle_ttl:
+                    self.backend.delete(session_id)
+                    return None
+                session = Session.from_dict(data)
+                with self._lock:
+                    self._store(session)
+                return session
+        return None
+
+    def get_or_create(self, session_id: Optional[str]) -> Session:
+        session = self.get(session_id) if session_id else None
+        return session or self.create()
+
+    def save(self, session: Session):
+        with self._lock:
+            self._store(session)
+        if self.backend is not None:
+            self.backend.set(session.id, session.to_dict())
+
+    async def get_or_create_async(self, session_id: Optional[str]) -> Session:
+        """get_or_create() without blocking the event loop on the persistent tier."""
+        if self.backend is None:
+            return self.get_or_create(session_id)
+        return await asyncio.to_thread(self.get_or_create, session_id)
+
+    async def save_async(self, session: Session):
+        """save() without blocking the event loop on the persistent tier."""
+        with self._lock:
+            self._store(session)
+        if self.backend is not None:
+            await asyncio.to_thread(self.backend.set, session.id, session.to_dict())
+
+    def purge_idle(self) -> int:
+        """
+        Drop sessions idle for longer than idle_ttl from both tiers; returns
+        how many persistent rows were removed. Idle rows are otherwise only
+        deleted when that session is requested again.
+        """
+        cutoff = time.time() - self.idle_ttl
+        with self._lock:
+            idle = [session_id for session_id, session in self._sessions.items() if session.updated_at < cutoff]
+            for session_id in idle:
+                del self._sessions[session_id]
+            self.expirations += len(idle)
+        return self.backend.purge_idle(cutoff) if self.backend is not None else 0
+
+    def _store(self, session: Session):
+        self._sessions[session.id] = session
+        self._sessions.move_to_end(session.id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'idle_ttl': self.idle_ttl,
+                'window_turns': self.window,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'persistent': self.backend is not None
+            }
@@ -0,0 +1,141 @@
+import asyncio
+import math
+import os
+import random
+import zlib
+from collections import OrderedDict
+from typing import AsyncIterator, Optional, Tuple
+
+
+class SimulatedRateLimitError(Exception):
+    """Injected stand-in for a provider's 429 response."""
+
+
+class SimulatedAPIError(Exception):
+    """Injected stand-in for a provider's 5xx/API error."""
+
+
+class SimulatedLLM:
+    """
+    Local stand-in for an LLM provider, selected with LLM_PROVIDER=simulated.
+    Needs no API key or network. Latency, token throughput, streaming chunk
+    size and injected errors are configurable, so the app and its retry,
+    failover and rate-limit logic can be load-tested offline.
+
+    A request waits a time-to-first-token drawn from the latency
+    distribution, then produces response_tokens at tokens_per_second.
+    System prompts seen recently count as cached input tokens, mimicking
+    provider prefix caching.
+    """
+
+    VOCABULARY = (
+        "what", "do", "you", "mean", "by", "that", "and", "how", "might", "we",
+        "know", "it", "is", "true", "consider", "whether", "a", "just", "person",
+        "would", "act", "differently", "if", "no", "one", "were", "watching",
+        "why", "does", "this", "matter", "to", "your", "understanding", "of",
+        "virtue", "knowledge", "the", "good", "life"
+    )
+
+    def __init__(
+        self,
+        latency_ms: float = 800.0,
+        latency_jitter: float = 0.5,
+        distribution: str = 'lognormal',
+        tokens_per_second: float = 50.0,
+        response_tokens: int = 150,
+        chunk_tokens: int = 5,
+        rate_limit_rate: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        if distribution not in ('constant', 'uniform', 'lognormal'):
+            raise ValueError(f"Unsupported latency distribution: {distribution}")
+        self.latency_ms = latency_ms
+        self.latency_jitter = latency_jitter
+        self.distribution = distribution
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self._cached_prefixes = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "SimulatedLLM":
+        seed = os.getenv('SIMULATED_SEED')
+        return cls(
+            latency_ms=float(os.getenv('SIMULATED_LATENCY_MS', '800')),
+            latency_jitter=float(os.getenv('SIMULATED_LATENCY_JITTER', '0.5')),
+            distribution=os.getenv('SIMULATED_LATENCY_DISTRIBUTION', 'lognormal').lower(),
+            tokens_per_second=float(os.getenv('SIMULATED_TOKENS_PER_SECOND', '50')),
+            response_tokens=int(os.getenv('SIMULATED_RESPONSE_TOKENS', '150')),
+            chunk_tokens=int(os.getenv('SIMULATED_CHUNK_TOKENS', '5')),
+            rate_limit_rate=float(os.getenv('SIMULATED_RATE_LIMIT_RATE', '0')),
+            error_rate=float(os.getenv('SIMULATED_ERROR_RATE', '0')),
+            seed=int(seed) if seed else None
+        )
+
+    def _first_token_delay(self) -> float:
+        mean = self.latency_ms / 1000
+        if self.distribution == 'constant' or self.latency_jitter <= 0:
+            return mean
+        if self.distribution == 'uniform':
+            spread = mean * self.latency_jitter
+            return max(0.0, self.random.uniform(mean - spread, mean + spread))
+        # Lognormal with the configured mean; jitter is the sigma of the
+        # underlying normal, which gives the long tail real providers show
+        if mean <= 0:
+            return 0.0
+        sigma = self.latency_jitter
+        mu = math.log(mean) - sigma ** 2 / 2
+        return self.random.lognormvariate(mu, sigma)
+
+    def _maybe_fail(self):
+        roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            raise SimulatedRateLimitError("Simulated rate limit exceeded")
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise SimulatedAPIError("Simulated API error")
+
+    def _tokens(self, prompt: str):
+        # Same prompt, same text, so cached and uncached runs are comparable
+        rng = random.Random(zlib.crc32(prompt.encode('utf-8')))
+        words = [rng.choice(self.VOCABULARY) for _ in range(self.response_tokens)]
+        for index in range(0, len(words), 12):
+            words[index] = words[index].capitalize()
+        return [word + ('?' if (i + 1) % 12 == 0 else '') for i, word in enumerate(words)]
+
+    def input_tokens(self, prompt: str, system: Optional[str] = None) -> Tuple[int, int]:
+        """Return (input_tokens, cached_input_tokens) at ~4 characters per token."""
+        system_tokens = len(system or '') // 4
+        cached = 0
+        if system:
+            if system in self._cached_prefixes:
+                self._cached_prefixes.move_to_end(system)
+                cached = system_tokens
+            else:
+                self._cached_prefixes[system] = True
+                if len(self._cached_prefixes) > 16:
+                    self._cached_prefixes.popitem(last=False)
+        return system_tokens + len(prompt) // 4, cached
+
+    async def generate(self, prompt: str, system: Optional[str] = None) -> Tuple[str, int, int, int]:
+        """Return (text, input_tokens, cached_input_tokens, output_tokens)."""
+        await asyncio.sleep(self._first_token_delay())
+        self._maybe_fail()
+        tokens = self._tokens(prompt)
+        if self.tokens_per_second > 0:
+            await asyncio.sleep(len(tokens) / self.tokens_per_second)
+        input_tokens, cached_tokens = self.input_tokens(prompt, system)
+        return ' '.join(tokens), input_tokens, cached_tokens, len(tokens)
+
+    async def stream(self, prompt: str, system: Optional[str] = None) -> AsyncIterator[str]:
+        await asyncio.sleep(self._first_token_delay())
+        self._maybe_fail()
+        tokens = self._tokens(prompt)
+        for index in range(0, len(tokens), self.chunk_tokens):
+            chunk = tokens[index:index + self.chunk_tokens]
+            if self.tokens_per_second > 0:
+                await asyncio.sleep(len(chunk) / self.tokens_per_second)
+            yield ('' if index == 0 else ' ') + ' '.join(chunk)
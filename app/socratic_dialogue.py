@@ -1,10 +1,14 @@
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, Optional
+
+from app.metrics import timed
 
 class SocraticDialogue:
     def __init__(self, llm_service, nlp_processor):
         self.llm_service = llm_service
         self.nlp_processor = nlp_processor
-        self.socratic_prompt_template = """You are a modern Socrates, engaging in philosophical dialogue using the Socratic method. 
+        # Static instructions, sent as a separate system prefix so providers
+        # can cache them instead of reprocessing them on every request
+        self.socratic_system_prompt = """You are a modern Socrates, engaging in philosophical dialogue using the Socratic method. 
 Your goal is to help the user think critically about their beliefs and assumptions through thoughtful questions.
 
 Guidelines:
@@ -15,7 +19,8 @@ Guidelines:
 5. Be encouraging and supportive
 6. Respond in a conversational, approachable manner
 
-User's message: {message}
+Please respond as Socrates would, focusing on helping the user explore their thoughts more deeply."""
+        self.socratic_prompt_template = """User's message: {message}
 
 Analysis of user's input:
 - Is a question: {is_question}
@@ -23,11 +28,9 @@ Analysis of user's input:
 - Word count: {word_count}
 {category_info}
 
-{context_info}
+{context_info}"""
 
-Please respond as Socrates would, focusing on helping the user explore their thoughts more deeply."""
-
-    async def generate_response(
+    def build_prompt(
         self, 
         message: str, 
         processed_input: Dict,
@@ -45,7 +48,7 @@ Please respond as Socrates would, focusing on helping the user explore their tho
         if category and category_description:
             category_info = f"\n- Philosophical category: {category} - {category_description}"
         
-        prompt = self.socratic_prompt_template.format(
+        return self.socratic_prompt_template.format(
             message=message,
             is_question=processed_input['is_question'],
             key_concepts=key_concepts,
@@ -53,6 +56,46 @@ Please respond as Socrates would, focusing on helping the user explore their tho
             category_info=category_info,
             context_info=context_info
         )
+
+    async def generate_response(
+        self, 
+        message: str, 
+        processed_input: Dict,
+        context: Optional[str] = None,
+        category: Optional[str] = None,
+        category_description: Optional[str] = None,
+        use_cache: bool = True,
+        usage: Optional[Dict] = None
+    ) -> str:
+        with timed('prompt'):
+            prompt = self.build_prompt(message, processed_input, context, category, category_description)
+        
+        with timed('llm'):
+            response = await self.llm_service.generate_response(
+                prompt,
+                use_cache=use_cache,
+                system=self.socratic_system_prompt,
+                usage=usage
+            )
+        return response
+
+    async def stream_response(
+        self, 
+        message: str, 
+        processed_input: Dict,
+        context: Optional[str] = None,
+        category: Optional[str] = None,
+        category_description: Optional[str] = None,
+        use_cache: bool = True,
+        usage: Optional[Dict] = None
+    ) -> AsyncIterator[str]:
+        with timed('prompt'):
+            prompt = self.build_prompt(message, processed_input, context, category, category_description)
         
-        response = await self.llm_service.generate_response(prompt)
-        return response
\ No newline at end of file
+        async for chunk in self.llm_service.stream_response(
+            prompt,
+            use_cache=use_cache,
+            system=self.socratic_system_prompt,
+            usage=usage
+        ):
+            yield chunk
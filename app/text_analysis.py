@@ -0,0 +1,140 @@
+import json
+import os
+import re
+import string
+from typing import Dict, Iterable, List, Union
+
+KEYWORDS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'philosophical_keywords.json')
+
+_QUESTION_WORDS = re.compile('what|why|how|when|where|who|which')
+_STRIP_PUNCTUATION = str.maketrans('', '', string.punctuation)
+
+
+def is_question(text: str, text_lower: str = None) -> bool:
+    """A question mark at the end, or a question word anywhere in the text."""
+    return bool(_QUESTION_WORDS.search(text_lower or text.lower())) or text.strip().endswith('?')
+
+
+def load_keyword_lexicon(path: str = KEYWORDS_PATH) -> Dict[str, List[str]]:
+    """Read a {category: [keyword, ...]} lexicon from a JSON file."""
+    with open(path) as f:
+        lexicon = json.load(f)
+    return {category: [word.lower() for word in words] for category, words in lexicon.items()}
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    Regex matching any of `words`, factored by common prefix
+    ("art|argument" becomes "ar(?:t|gument)"), so the regex engine follows one
+    branch per character instead of trying every word in turn.
+    """
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            # A word ends here: the longer continuations are optional
+            return '(?:' + pattern + ')?' if len(branches) == 1 else pattern + '?'
+        return pattern
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    The keyword lexicon compiled into one regex, so a single pass over the
+    text finds every category with a keyword, however many terms the lexicon
+    holds. Keywords match whole words only ("art" matches neither "article"
+    nor "party"), so the lexicon lists the inflections it wants to count
+    ("exist", "exists", "existence").
+    """
+
+    def __init__(self, lexicon: Dict[str, List[str]]):
+        self.lexicon = {category: list(words) for category, words in lexicon.items()}
+        self.categories = list(lexicon)
+        word_categories: Dict[str, set] = {}
+        for category, category_words in lexicon.items():
+            for word in category_words:
+                word_categories.setdefault(word, set()).add(category)
+        self._word_categories = {word: frozenset(categories) for word, categories in word_categories.items()}
+        self._pattern = re.compile(r'\b' + _trie_pattern(word_categories) + r'\b') if word_categories else None
+
+    @classmethod
+    def from_file(cls, path: str = KEYWORDS_PATH) -> "KeywordMatcher":
+        return cls(load_keyword_lexicon(path))
+
+    def find_categories(self, text_lower: str) -> List[str]:
+        """Categories (in lexicon order) with a keyword in the lowercased text."""
+        if self._pattern is None:
+            return []
+        word_categories = self._word_categories
+        found = set().union(*[word_categories[word] for word in set(self._pattern.findall(text_lower))])
+        return [category for category in self.categories if category in found]
+
+
+# Compiled once from app/data/philosophical_keywords.json
+KEYWORD_MATCHER = KeywordMatcher.from_file()
+
+
+def find_keyword_categories(text_lower: str) -> List[str]:
+    """Categories (in lexicon order) with a keyword in the lowercased text."""
+    return KEYWORD_MATCHER.find_categories(text_lower)
+
+
+class AnalyzedText:
+    """
+    A message plus the normalized forms NLPProcessor and
+    PhilosophicalCategorizer both need. Each is computed on first access and
+    reused, so a message is lowercased, cleaned and scanned for keywords once
+    however many components read it.
+    """
+
+    __slots__ = ('original', '_lower', '_normalized', '_is_question', '_keyword_categories')
+
+    def __init__(self, text: str):
+        self.original = text
+        self._lower = None
+        self._normalized = None
+        self._is_question = None
+        self._keyword_categories = None
+
+    @property
+    def lower(self) -> str:
+        if self._lower is None:
+            self._lower = self.original.lower()
+        return self._lower
+
+    @property
+    def normalized(self) -> str:
+        """Lowercase, punctuation removed, whitespace collapsed (the categorizer's TF-IDF input)."""
+        if self._normalized is None:
+            self._normalized = ' '.join(self.lower.translate(_STRIP_PUNCTUATION).split())
+        return self._normalized
+
+    @property
+    def is_question(self) -> bool:
+        if self._is_question is None:
+            self._is_question = is_question(self.original, self.lower)
+        return self._is_question
+
+    @property
+    def keyword_categories(self) -> List[str]:
+        if self._keyword_categories is None:
+            self._keyword_categories = find_keyword_categories(self.lower)
+        return self._keyword_categories
+
+    def __repr__(self):
+        return f"AnalyzedText({self.original!r})"
+
+
+def analyze_text(text: Union[str, AnalyzedText]) -> AnalyzedText:
+    """Wrap a message in an AnalyzedText, or return it unchanged if it already is one."""
+    return text if isinstance(text, AnalyzedText) else AnalyzedText(text)
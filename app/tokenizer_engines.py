@@ -0,0 +1,121 @@
+"""
+Word tokenizer engines for NLPProcessor, selected with NLP_TOKENIZER.
+
+  nltk   - nltk.word_tokenize (punkt sentence splitting plus the Treebank
+           regexes); the reference output, but the slowest
+  regex  - a single precompiled regex that follows the Treebank conventions
+           for the cases common in chat messages (clitics, n't, quotes,
+           final periods, numbers); see tokenizer_parity.py for how closely
+           it matches nltk
+  split  - str.split(), the old fallback
+
+All engines take a string and return a list of token strings.
+"""
+
+import re
+from typing import Dict, List
+
+# Words whose trailing period punkt does not treat as a sentence end
+ABBREVIATIONS = {
+    'mr', 'mrs', 'ms', 'dr', 'prof', 'st', 'jr', 'sr', 'vs', 'etc', 'cf', 'al',
+    'e.g', 'i.e', 'u.s', 'u.k', 'no', 'vol', 'fig', 'ca'
+}
+
+_CLITIC = r"(?:'(?:[sSmMdD]|ll|LL|re|RE|ve|VE))"
+
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<ellipsis>\.{2,})
+    | (?P<dashes>--)
+    | (?P<backticks>`+)
+    | (?P<quote>")
+    | (?P<unicode_quote>[«“‘„»”’])
+    | (?P<negation>(?i:n't))(?=\W|$)
+    | (?P<clitic>(?<=\w)""" + _CLITIC + r""")(?=\W|$)
+    | (?P<word>
+        (?i:\w+?(?=n't(?:\W|$)))                 # 'do' in don't, 'ca' in can't
+      | (?i:(?<!\w)(?:can(?=not\b)|gon(?=na\b)|got(?=ta\b)|wan(?=na\s)|lem(?=me\b)|gim(?=me\b)|more(?='n\b)))
+      | (?:'(?!(?i:re|ve|ll|m|t|s|d|n))(?=\w\w))?  # a leading quote stays on longer words
+        [/+=^~|\\]*\w+(?:
+            (?:[.,:](?=\d))\d+                    # 3.88, 1,000, 10:30
+          | (?!""" + _CLITIC + r"""(?:\W|$))[-.']\w+   # well-known, e.g, o'clock
+          | [+=/^~|\\]\w+                          # symbols NLTK leaves inside words
+        )*
+      )
+    | (?P<punct>\S)
+    """,
+    re.VERBOSE
+)
+
+# A period ends a sentence when only closing quotes/brackets and whitespace
+# follow before the end of the text or the start of a new sentence
+_SENTENCE_END_RE = re.compile(r"""[\]\)}>"'»”’]*(?:\s*$|\s+[^a-z\s])""")
+
+
+class SplitTokenizer:
+    name = 'split'
+
+    def tokenize(self, text: str) -> List[str]:
+        return text.split()
+
+
+class RegexTokenizer:
+    """Single-pass approximation of nltk.word_tokenize; needs no NLTK data."""
+
+    name = 'regex'
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens = []
+        append = tokens.append
+        search = _TOKEN_RE.search
+        pos = 0
+        while True:
+            match = search(text, pos)
+            if match is None:
+                return tokens
+            kind = match.lastgroup
+            token = match.group()
+            pos = match.end()
+            if kind == 'word':
+                # Treebank keeps a period on a word unless it ends the sentence
+                if text.startswith('.', pos) and not text.startswith('..', pos) and (
+                    token.lower() in ABBREVIATIONS or not _SENTENCE_END_RE.match(text, pos + 1)
+                ):
+                    token += '.'
+                    pos += 1
+            elif kind == 'quote':
+                token = '``' if match.start() == 0 or text[match.start() - 1] in ' \t\n([{<' else "''"
+            append(token)
+
+
+class NLTKTokenizer:
+    """
+    nltk.word_tokenize, imported on first use. Raises LookupError when punkt
+    is missing; NLPProcessor.word_tokenize catches that and uses the regex
+    engine instead.
+    """
+
+    name = 'nltk'
+
+    def __init__(self):
+        self._tokenize = None
+
+    def tokenize(self, text: str) -> List[str]:
+        if self._tokenize is None:
+            import nltk
+            self._tokenize = nltk.word_tokenize
+        return self._tokenize(text)
+
+
+ENGINES: Dict[str, type] = {
+    'nltk': NLTKTokenizer,
+    'regex': RegexTokenizer,
+    'split': SplitTokenizer,
+}
+
+
+def get_tokenizer(name: str):
+    try:
+        return ENGINES[name.lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown tokenizer engine: {name} (choose from {', '.join(ENGINES)})")
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the NLP, categorization and prompt-building components.
+
+Each benchmark runs over input-length tiers (one sentence up to several KB)
+and reports throughput and latency percentiles. Results are compared with
+the stored baseline (benchmarks/baseline.json by default); the run exits
+non-zero if any benchmark is slower than the baseline by more than the
+tolerance. The baseline also records which NLTK resources were available,
+since the fallbacks have very different costs; results are not compared
+against a baseline recorded with different NLTK data.
+
+    python benchmark.py                      # run and compare with the baseline
+    python benchmark.py --update-baseline    # run and store results as the new baseline
+    python benchmark.py --filter nlp --tolerance 0.5
+    python benchmark.py --filter analyzer --update-baseline   # re-baseline only what a change affects
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'baseline.json')
+
+SENTENCE = "Is it ever right to lie in order to protect someone we love from harm?"
+PARAGRAPH = (
+    "I have been wondering whether knowledge is simply justified true belief. "
+    "If I believe the clock says noon, and it does, but the clock stopped yesterday, "
+    "do I really know what time it is? It seems that luck plays a role here, and I am "
+    "not sure how to rule it out. Perhaps knowledge requires something more, such as a "
+    "reliable process or an explanation of why the belief is true. What do you think "
+    "separates knowing from merely being right by accident?"
+)
+
+TIERS = {
+    'sentence': SENTENCE,
+    'paragraph': PARAGRAPH,
+    'page_2kb': (PARAGRAPH + ' ') * 5,
+    'long_8kb': (PARAGRAPH + ' ') * 18,
+}
+
+
+def measure(fn, arg, min_time: float, min_runs: int):
+    """Call fn(arg) repeatedly; return per-call latencies in seconds."""
+    fn(arg)  # warm-up (lazy loads, caches)
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < min_runs or time.perf_counter() - started < min_time:
+        t0 = time.perf_counter()
+        fn(arg)
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+def summarize(latencies):
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    return {
+        'runs': len(ordered),
+        'ops_per_sec': round(len(ordered) / sum(ordered), 2),
+        'p50_ms': round(statistics.median(ordered) * 1000, 4),
+        'p95_ms': round(pct(95) * 1000, 4),
+        'p99_ms': round(pct(99) * 1000, 4),
+    }
+
+
+def timed_once(fn, repeats: int = 5):
+    """Latencies for a one-off operation such as model loading."""
+    latencies = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+class BaselineMismatch(Exception):
+    """The baseline was recorded in an environment these results cannot be compared with."""
+
+
+def build_benchmarks():
+    """Return {name: (callable, argument)}, one-off {name: callable} and the NLTK resource status."""
+    from app.nlp_processor import NLPProcessor, PIPELINE_FIELDS
+    from app.ml_categorizer import PhilosophicalCategorizer
+    from app.socratic_dialogue import SocraticDialogue
+    from app.analysis_pool import TextAnalyzer
+    from app.tokenizer_engines import ENGINES, get_tokenizer
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        nlp_processor = NLPProcessor()
+        categorizer = PhilosophicalCategorizer()
+        if not categorizer.load_model():
+            categorizer.train()
+        nltk_status = nlp_processor.resource_status()
+    dialogue = SocraticDialogue(None, nlp_processor)
+    analyzer = TextAnalyzer(nlp_processor, categorizer)
+
+    tokenizers = {}
+    for engine in ENGINES:
+        tokenizer = get_tokenizer(engine)
+        try:
+            tokenizer.tokenize(SENTENCE)
+        except LookupError:
+            continue  # nltk without punkt installed
+        tokenizers[engine] = tokenizer
+
+    per_input = {}
+    for tier, text in TIERS.items():
+        processed = nlp_processor.process(text)
+        per_input[f'nlp.process[{tier}]'] = (nlp_processor.process, text)
+        per_input[f'nlp.process_pipeline[{tier}]'] = (lambda t: nlp_processor.process(t, PIPELINE_FIELDS), text)
+        per_input[f'categorizer.predict[{tier}]'] = (categorizer.predict, text)
+        per_input[f'analyzer.analyze[{tier}]'] = (lambda t: analyzer.analyze(t, PIPELINE_FIELDS), text)
+        per_input[f'categorizer.extract_keywords[{tier}]'] = (categorizer.extract_keywords, text)
+        per_input[f'categorizer.preprocess_text[{tier}]'] = (categorizer.preprocess_text, text)
+        per_input[f'dialogue.build_prompt[{tier}]'] = (
+            lambda args: dialogue.build_prompt(*args),
+            (text, processed, None, 'epistemology', categorizer.get_category_description('epistemology'))
+        )
+        for engine, tokenizer in tokenizers.items():
+            per_input[f'tokenizer.{engine}[{tier}]'] = (tokenizer.tokenize, text)
+
+    # Many short texts at once: a loop over process() against process_batch()
+    batch = [f"{SENTENCE} ({i})" if i % 3 else PARAGRAPH for i in range(10000)]
+    per_input['nlp.process_loop[batch_10k]'] = (lambda texts: [nlp_processor.process(t, PIPELINE_FIELDS) for t in texts], batch)
+    per_input['nlp.process_batch[batch_10k]'] = (lambda texts: nlp_processor.process_batch(texts, PIPELINE_FIELDS), batch)
+    per_input['categorizer.predict_loop[batch_10k]'] = (lambda texts: [categorizer.predict(t) for t in texts], batch)
+    per_input['categorizer.predict_batch[batch_10k]'] = (categorizer.predict_batch, batch)
+
+    def load_categorizer():
+        PhilosophicalCategorizer().load_model()
+
+    def init_nlp():
+        with contextlib.redirect_stdout(io.StringIO()):
+            NLPProcessor()
+
+    one_off = {
+        'categorizer.load_model': load_categorizer,
+        'nlp.init': init_nlp,
+    }
+    return per_input, one_off, nltk_status
+
+
+def compare(results, baseline, tolerance, nltk_status):
+    """Return a list of regression messages (empty when everything is within tolerance).
+
+    Raises BaselineMismatch when the baseline was recorded with different
+    NLTK resources available.
+    """
+    recorded = baseline.get('nltk')
+    if recorded != nltk_status:
+        raise BaselineMismatch(f"baseline was recorded with NLTK resources {recorded}, this run has {nltk_status}")
+    regressions = []
+    for name, current in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            if previous[key] > 0 and current[key] > previous[key] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: {key} {current[key]:.4f} vs baseline {previous[key]:.4f} "
+                    f"(+{(current[key] / previous[key] - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Component micro-benchmarks")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument('--update-baseline', action='store_true', help="Store this run as the baseline")
+    parser.add_argument('--tolerance', type=float, default=float(os.getenv('BENCH_TOLERANCE', '0.25')),
+                        help="Allowed slowdown before failing, as a fraction (default 0.25 = 25%%)")
+    parser.add_argument('--min-time', type=float, default=0.5, help="Minimum seconds per benchmark")
+    parser.add_argument('--min-runs', type=int, default=20, help="Minimum calls per benchmark")
+    parser.add_argument('--filter', default='', help="Only run benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    per_input, one_off, nltk_status = build_benchmarks()
+
+    results = {}
+    print(f"{'benchmark':48} {'ops/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    print("-" * 92)
+    for name, (fn, arg) in per_input.items():
+        if args.filter in name:
+            results[name] = summarize(measure(fn, arg, args.min_time, args.min_runs))
+    for name, fn in one_off.items():
+        if args.filter in name:
+            results[name] = summarize(timed_once(fn))
+    for name, r in results.items():
+        print(f"{name:48} {r['ops_per_sec']:>10} {r['p50_ms']:>10} {r['p95_ms']:>10} {r['p99_ms']:>10}")
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                previous = json.load(f)
+            if previous.get('nltk') == nltk_status:
+                baseline = previous.get('results', {})
+            elif args.filter:
+                print(f"\nNot updating {args.baseline}: it was recorded with NLTK resources "
+                      f"{previous.get('nltk')}, this run has {nltk_status}; rerun without --filter to replace it")
+                return 2
+        baseline.update(results)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'nltk': nltk_status,
+                'results': baseline
+            }, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    try:
+        regressions = compare(results, baseline, args.tolerance, nltk_status)
+    except BaselineMismatch as e:
+        print(f"\nNot comparing: {e}")
+        return 2
+    if regressions:
+        print(f"\nRegressions beyond {args.tolerance:.0%} tolerance:")
+        for message in regressions:
+            print(f"  {message}")
+        return 1
+    print(f"\nNo regressions beyond {args.tolerance:.0%} tolerance")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
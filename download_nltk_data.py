@@ -1,33 +1,55 @@
 #!/usr/bin/env python3
 """
-Download all required NLTK data for the Socrates AI application
+Download all required NLTK data for the Socrates AI application.
+
+The resources go into the project's nltk_data/ directory together with a
+manifest pinning their sizes and checksums, so the app can start in
+bundled mode (NLTK_DATA_MODE=bundled) without any network access.
+
+    python download_nltk_data.py            # download and write the manifest
+    python download_nltk_data.py --verify   # check bundled data against the manifest
 """
 
-import nltk
+import argparse
 import sys
 
-def download_nltk_resources():
+from app.nlp_processor import NLTK_DATA_DIR, NLTK_RESOURCES, verify_manifest, write_manifest
+
+def download_nltk_resources(data_dir: str = NLTK_DATA_DIR):
     """Download all required NLTK resources"""
-    resources = [
-        'punkt',
-        'punkt_tab',
-        'wordnet',
-        'stopwords',
-        'averaged_perceptron_tagger',
-        'averaged_perceptron_tagger_eng'
-    ]
-    
-    print("Downloading NLTK resources...")
-    
-    for resource in resources:
+    import nltk
+
+    print(f"Downloading NLTK resources into {data_dir}...")
+
+    for _, resource in NLTK_RESOURCES:
         try:
             print(f"Downloading {resource}...", end=' ')
-            nltk.download(resource, quiet=True)
-            print("✓")
+            if nltk.download(resource, download_dir=data_dir, quiet=True):
+                print("✓")
+            else:
+                print("✗ Failed")
         except Exception as e:
             print(f"✗ Failed: {e}")
-    
+
+    manifest = write_manifest(data_dir)
+    print(f"Wrote manifest for {len(manifest['resources'])} resource(s)")
     print("\nDone! All NLTK resources have been downloaded.")
 
+def verify_nltk_resources(data_dir: str = NLTK_DATA_DIR) -> bool:
+    """Check sizes and checksums of the bundled resources"""
+    problems = verify_manifest(data_dir, checksums=True)
+    for problem in problems:
+        print(f"✗ {problem}")
+    if not problems:
+        print("✓ Bundled NLTK data matches the manifest")
+    return not problems
+
 if __name__ == "__main__":
-    download_nltk_resources()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Download or verify bundled NLTK data")
+    parser.add_argument('--dir', default=NLTK_DATA_DIR, help="Target directory (default: ./nltk_data)")
+    parser.add_argument('--verify', action='store_true', help="Verify the bundled data instead of downloading")
+    args = parser.parse_args()
+
+    if args.verify:
+        sys.exit(0 if verify_nltk_resources(args.dir) else 1)
+    download_nltk_resources(args.dir)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Bulk-process a JSONL file of questions through the Socratic dialogue pipeline.
+
+Each input line is a JSON object with a "message" (and optionally "id" and
+"context"). Each output line carries the id, the NLP analysis, the category
+and either the Socratic response or an error.
+
+The input is read in fixed-size chunks, so memory use does not depend on the
+file size. NLP processing and categorization run in a pool of worker
+processes. LLM calls for a chunk run concurrently while the next chunk is
+being analyzed. After every chunk the input/output offsets are written to a
+checkpoint file, so a crashed run can be resumed with --resume.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+
+from app.text_analysis import AnalyzedText
+
+_nlp_processor = None
+_categorizer = None
+_fields = None
+
+
+def init_worker(extra_fields=()):
+    """Load NLTK data and the categorizer once per worker process."""
+    global _nlp_processor, _categorizer, _fields
+    from app.nlp_processor import NLPProcessor, PIPELINE_FIELDS
+    from app.ml_categorizer import PhilosophicalCategorizer
+
+    _nlp_processor = NLPProcessor()
+    _fields = PIPELINE_FIELDS + tuple(extra_fields)
+    _categorizer = PhilosophicalCategorizer()
+    if not _categorizer.load_model():
+        print("Warning: ML model not found, questions will not be categorized. Run: python train_categorizer.py")
+        _categorizer = None
+
+
+def analyze_batch(records):
+    """CPU stage for a slice of a chunk: batch NLP processing, then batch categorization."""
+    valid = [record for record in records if 'error' not in record]
+    analyses = [AnalyzedText(record['message']) for record in valid]
+    try:
+        processed = _nlp_processor.process_batch(analyses, _fields)
+    except Exception:
+        # Fall back to one record at a time so only the failing ones get an error
+        return [analyze(record) for record in records]
+    for record, processed_input in zip(valid, processed):
+        record['processed_input'] = processed_input
+        record['category'] = None
+        record['category_description'] = None
+    if not _categorizer or not valid:
+        return records
+    try:
+        predictions = _categorizer.predict_batch(analyses)
+    except Exception:
+        for record, analyzed in zip(valid, analyses):
+            categorize(record, analyzed)
+        return records
+    for record, (category, _) in zip(valid, predictions):
+        record['category'] = category
+        record['category_description'] = _categorizer.get_category_description(category)
+    return records
+
+
+def analyze(record):
+    """CPU stage: NLP processing and categorization for one input record."""
+    if 'error' in record:
+        return record
+    analyzed = AnalyzedText(record['message'])
+    try:
+        record['processed_input'] = _nlp_processor.process(analyzed, _fields)
+    except Exception as e:
+        record['error'] = f"Analysis failed: {e}"
+        return record
+    return categorize(record, analyzed)
+
+
+def categorize(record, analyzed=None):
+    """Categorize a record, reusing the AnalyzedText from NLP processing when given."""
+    try:
+        record['category'] = None
+        record['category_description'] = None
+        if _categorizer:
+            category, _ = _categorizer.predict(analyzed or record['message'])
+            record['category'] = category
+            record['category_description'] = _categorizer.get_category_description(category)
+    except Exception as e:
+        record['error'] = f"Analysis failed: {e}"
+    return record
+
+
+def parse_line(line_number, line):
+    try:
+        data = json.loads(line)
+    except ValueError as e:
+        return {'id': line_number, 'error': f"Invalid JSON: {e}"}
+    if isinstance(data, str):
+        data = {'message': data}
+    if not isinstance(data, dict) or not data.get('message'):
+        return {'id': data.get('id', line_number) if isinstance(data, dict) else line_number,
+                'error': "Missing 'message'"}
+    return {
+        'id': data.get('id', line_number),
+        'message': data['message'],
+        'context': data.get('context')
+    }
+
+
+def read_chunks(input_file, start_offset, start_line, chunk_size):
+    """Yield (records, end_offset, end_line) for successive chunks of the input."""
+    input_file.seek(start_offset)
+    line_number = start_line
+    records = []
+    while True:
+        raw = input_file.readline()
+        if not raw:
+            break
+        line_number += 1
+        line = raw.decode('utf-8').strip()
+        if line:
+            records.append(parse_line(line_number, line))
+        if len(records) >= chunk_size:
+            yield records, input_file.tell(), line_number
+            records = []
+    if records:
+        yield records, input_file.tell(), line_number
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    # Write-then-rename so a crash never leaves a half-written checkpoint
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+async def respond(socratic_dialogue, semaphore, record):
+    """LLM stage for one analyzed record."""
+    if 'error' in record:
+        return record
+    try:
+        async with semaphore:
+            record['response'] = await socratic_dialogue.generate_response(
+                record['message'],
+                record['processed_input'],
+                record.get('context'),
+                record.get('category'),
+                record.get('category_description')
+            )
+    except Exception as e:
+        record['error'] = str(getattr(e, 'detail', e))
+    return record
+
+
+async def run(args):
+    from app.llm_service import LLMService
+    from app.socratic_dialogue import SocraticDialogue
+
+    socratic_dialogue = None
+    if not args.skip_llm:
+        socratic_dialogue = SocraticDialogue(LLMService(), None)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    loop = asyncio.get_running_loop()
+
+    checkpoint = {'input_offset': 0, 'input_line': 0, 'output_offset': 0, 'processed': 0}
+    if args.resume:
+        checkpoint = load_checkpoint(args.checkpoint) or checkpoint
+        if checkpoint['processed']:
+            print(f"Resuming after line {checkpoint['input_line']} ({checkpoint['processed']} records done)")
+    elif os.path.exists(args.checkpoint):
+        print(f"Checkpoint {args.checkpoint} exists; use --resume to continue or delete it to start over")
+        return 1
+
+    started = time.time()
+    processed_this_run = 0
+
+    with open(args.input, 'rb') as input_file, \
+            open(args.output, 'ab' if args.resume else 'wb') as output_file, \
+            Pool(args.workers, initializer=init_worker, initargs=(args.fields,)) as pool:
+        # Drop anything written after the last checkpoint by a crashed run
+        output_file.truncate(checkpoint['output_offset'])
+        output_file.seek(checkpoint['output_offset'])
+
+        chunks = read_chunks(input_file, checkpoint['input_offset'], checkpoint['input_line'], args.chunk_size)
+
+        def submit(chunk):
+            records, end_offset, end_line = chunk
+            # One slice per worker, each processed as a batch
+            size = max(1, -(-len(records) // args.workers))
+            slices = [records[i:i + size] for i in range(0, len(records), size)]
+            return pool.map_async(analyze_batch, slices), end_offset, end_line
+
+        pending = next((submit(chunk) for chunk in chunks), None)
+        while pending is not None:
+            analysis, end_offset, end_line = pending
+            records = [record for part in await loop.run_in_executor(None, analysis.get) for record in part]
+
+            # Start analyzing the next chunk while this one waits on the LLM
+            pending = next((submit(chunk) for chunk in chunks), None)
+
+            if socratic_dialogue is not None:
+                records = await asyncio.gather(*[respond(socratic_dialogue, semaphore, r) for r in records])
+
+            for record in records:
+                output_file.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+            output_file.flush()
+            os.fsync(output_file.fileno())
+
+            processed_this_run += len(records)
+            checkpoint = {
+                'input_offset': end_offset,
+                'input_line': end_line,
+                'output_offset': output_file.tell(),
+                'processed': checkpoint['processed'] + len(records)
+            }
+            save_checkpoint(args.checkpoint, checkpoint)
+
+            elapsed = time.time() - started
+            print(f"Processed {checkpoint['processed']} records "
+                  f"({processed_this_run / elapsed:.1f}/s this run)")
+
+    print(f"Done. Results written to {args.output}")
+    # No checkpoint is written when the input has no records
+    if os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-process a JSONL file of questions")
+    parser.add_argument('input', help="Input JSONL file, one {\"message\": ...} object per line")
+    parser.add_argument('output', help="Output JSONL file")
+    parser.add_argument('--checkpoint', help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument('--resume', action='store_true', help="Resume from the checkpoint of a previous run")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Worker processes for NLP and categorization")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent LLM requests")
+    parser.add_argument('--chunk-size', type=int, default=256, help="Records per chunk")
+    parser.add_argument('--fields', type=lambda value: tuple(f for f in value.split(',') if f), default=(),
+                        help="Extra analysis fields to include, comma-separated (e.g. pos_tags,tokens)")
+    parser.add_argument('--skip-llm', action='store_true', help="Only run NLP and categorization")
+    args = parser.parse_args()
+    args.checkpoint = args.checkpoint or args.output + '.checkpoint'
+
+    from app.nlp_processor import FIELDS
+    unknown = set(args.fields) - set(FIELDS)
+    if unknown:
+        parser.error(f"unknown field(s) {', '.join(sorted(unknown))}; choose from {', '.join(FIELDS)}")
+
+    load_dotenv()
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
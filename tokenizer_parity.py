@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Compare the tokenizer engines (app/tokenizer_engines.py) with NLTK's
+word_tokenize on a corpus of chat-style questions, and time them.
+
+    python tokenizer_parity.py                       # benchmarks/tokenizer_corpus.txt
+    python tokenizer_parity.py my_corpus.txt --show-diffs
+    python tokenizer_parity.py --min-parity 0.95     # exit 1 if regex matches fewer lines
+
+Parity is the share of lines tokenized exactly like NLTK, plus token-level
+F1 for partial matches. When the punkt model is not installed, the
+reference is NLTK's Treebank word tokenizer over a simple sentence splitter
+(punkt's job), which is noted in the output. That splitter uses the regex
+engine's own ABBREVIATIONS list, so a fallback run is only a partial check;
+parity claims need a run against nltk.word_tokenize with punkt installed.
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.tokenizer_engines import ABBREVIATIONS, ENGINES, get_tokenizer
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'tokenizer_corpus.txt')
+
+_SENTENCE_BREAK = re.compile(r"""(?<=[.!?])["')\]]?\s+(?=[^a-z\s])""")
+
+
+def reference_tokenizer():
+    """Return (tokenize, description) for the NLTK reference."""
+    import nltk
+    try:
+        nltk.word_tokenize("Check punkt.")
+        return nltk.word_tokenize, "nltk.word_tokenize"
+    except LookupError:
+        from nltk.tokenize import NLTKWordTokenizer
+        treebank = NLTKWordTokenizer()
+
+        def tokenize(text):
+            sentences, start = [], 0
+            for match in _SENTENCE_BREAK.finditer(text):
+                previous_word = text[start:match.start()].split()[-1:] or ['']
+                if previous_word[0].rstrip('.').lower() in ABBREVIATIONS:
+                    continue
+                sentences.append(text[start:match.end()])
+                start = match.end()
+            sentences.append(text[start:])
+            return [token for sentence in sentences for token in treebank.tokenize(sentence)]
+
+        return tokenize, ("NLTK Treebank tokenizer + simple sentence splitter sharing the regex engine's "
+                          "abbreviations (punkt not installed; partial check only)")
+
+
+def token_f1(expected, actual):
+    overlap = sum((Counter(expected) & Counter(actual)).values())
+    if not expected and not actual:
+        return 1.0
+    if not overlap:
+        return 0.0
+    precision = overlap / len(actual)
+    recall = overlap / len(expected)
+    return 2 * precision * recall / (precision + recall)
+
+
+def throughput(tokenize, lines, min_time=0.5):
+    runs, tokens = 0, 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < min_time:
+        for line in lines:
+            tokens += len(tokenize(line))
+        runs += 1
+    elapsed = time.perf_counter() - started
+    return runs * len(lines) / elapsed, tokens / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tokenizer engine parity and speed")
+    parser.add_argument('corpus', nargs='?', default=DEFAULT_CORPUS, help="One text per line")
+    parser.add_argument('--show-diffs', action='store_true', help="Print lines that differ from NLTK")
+    parser.add_argument('--min-parity', type=float, default=None,
+                        help="Fail if the regex engine matches fewer than this share of lines")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    reference, description = reference_tokenizer()
+    expected = [reference(line) for line in lines]
+    print(f"Reference: {description}")
+    print(f"Corpus: {len(lines)} lines, {sum(map(len, expected))} reference tokens\n")
+
+    print(f"{'engine':8} {'exact lines':>12} {'token F1':>9} {'texts/s':>10} {'tokens/s':>11}")
+    print("-" * 54)
+    ref_texts, ref_tokens = throughput(reference, lines)
+    print(f"{'nltk':8} {'(reference)':>12} {'':>9} {ref_texts:>10.0f} {ref_tokens:>11.0f}")
+
+    parity = {}
+    for name in ENGINES:
+        if name == 'nltk':
+            continue
+        tokenize = get_tokenizer(name).tokenize
+        actual = [tokenize(line) for line in lines]
+        exact = sum(a == e for a, e in zip(actual, expected)) / len(lines)
+        f1 = sum(token_f1(e, a) for a, e in zip(actual, expected)) / len(lines)
+        texts_per_sec, tokens_per_sec = throughput(tokenize, lines)
+        parity[name] = exact
+        print(f"{name:8} {exact:>12.1%} {f1:>9.3f} {texts_per_sec:>10.0f} {tokens_per_sec:>11.0f}")
+
+        if args.show_diffs:
+            for line, a, e in zip(lines, actual, expected):
+                if a != e:
+                    print(f"    {line}\n      {name}: {a}\n      nltk: {e}")
+
+    if args.min_parity is not None and parity['regex'] < args.min_parity:
+        print(f"\nregex parity {parity['regex']:.1%} is below {args.min_parity:.1%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
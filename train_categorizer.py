@@ -2,8 +2,16 @@
 """
 Script to train the philosophical categorizer model.
 Run this script to create or update the ML model.
+
+    python train_categorizer.py            # train and write models/philosophy_categorizer.model
+    python train_categorizer.py --convert  # rewrite the pickles of older versions as the artifact
+    python train_categorizer.py --if-missing  # build step: train only if no usable model loads
+
+The app never trains at startup (see CATEGORIZER_MODE), so deployments run
+this at build time: bin/post_compile on Heroku, the Dockerfile, make setup.
 """
 
+import argparse
 import os
 import sys
 
@@ -11,6 +19,40 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app.ml_categorizer import PhilosophicalCategorizer
+from app.text_analysis import KEYWORD_MATCHER
+
+def convert():
+    """Load the legacy pickled model and save it as the versioned artifact, without retraining."""
+    categorizer = PhilosophicalCategorizer()
+    if not (os.path.exists(categorizer.model_path) and os.path.exists(categorizer.vectorizer_path)):
+        print(f"No pickled model found at {categorizer.model_path}")
+        return 1
+    categorizer._load_pickles()
+    categorizer.save_model()
+    return 0
+
+def model_loads() -> bool:
+    """
+    True if the app would load a model artifact as is. Legacy pickles, and an
+    artifact trained on another keyword lexicon (the committed one after
+    philosophical_keywords.json was edited), don't count.
+    """
+    categorizer = PhilosophicalCategorizer()
+    try:
+        loaded = categorizer.load_model()
+    except Exception as e:
+        print(f"Existing model is unusable ({e}); retraining")
+        return False
+    if loaded and categorizer.load_stats['source'] == 'pickle':
+        # May predate the current features; use --convert to keep it as it is
+        print(f"Only legacy pickles found ({categorizer.load_stats['path']}); training the model artifact")
+        return False
+    if loaded and categorizer.features.lexicon != KEYWORD_MATCHER.lexicon:
+        print(f"Model at {categorizer.artifact_path} was trained on another keyword lexicon; retraining")
+        return False
+    if loaded:
+        print(f"Model already present ({categorizer.artifact_path}); not retraining")
+    return loaded
 
 def main():
     print("=" * 60)
@@ -60,4 +102,12 @@ def main():
     print("=" * 60)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the philosophical categorizer")
+    parser.add_argument('--convert', action='store_true', help="Convert legacy pickles to the model artifact instead of training")
+    parser.add_argument('--if-missing', action='store_true', help="Only train when no usable model is present")
+    args = parser.parse_args()
+    if args.convert:
+        sys.exit(convert())
+    if args.if_missing and model_loads():
+        sys.exit(0)
     main()
\ No newline at end of file